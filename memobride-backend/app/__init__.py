@@ -11,7 +11,8 @@ db = SQLAlchemy()
 bcrypt = Bcrypt()
 jwt = JWTManager()
 
-def create_app():
+def create_app(config=None):
+    """Build the app; config (a dict) overrides the defaults below, e.g. the database URI"""
     app = Flask(__name__)
 
     # CORS Configuration
@@ -30,11 +31,19 @@ def create_app():
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+    # Let the reverse proxy send photo bytes: 'x-accel' (nginx) or 'x-sendfile' (Apache, lighttpd)
+    app.config['PHOTO_SENDFILE'] = os.environ.get('PHOTO_SENDFILE')
+    # nginx `internal` location that aliases UPLOAD_FOLDER, used in x-accel mode
+    app.config['PHOTO_X_ACCEL_PREFIX'] = os.environ.get('PHOTO_X_ACCEL_PREFIX', '/protected-uploads/')
+
     # Database configuration
     basedir = os.path.abspath(os.path.dirname(__file__))
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "app.db")}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    if config:
+        app.config.from_mapping(config)
+
     # Initialize extensions with app
     db.init_app(app)
     bcrypt.init_app(app)
@@ -49,8 +58,19 @@ def create_app():
         from app.models import User, FamilyMember, UserActivity, ActivityCompletion, MissedActivity, MemoryPhoto, GameSession
         db.create_all()
 
-        # Create default activities for ALL users
-        create_default_activities_for_all_users()
+        # Bring existing tables up to the current schema
+        from app.migrations import run_migrations
+        run_migrations()
+
+        # Temp files of uploads cut off by a crash
+        from app.services.photostore import remove_stale_uploads
+        remove_stale_uploads()
+
+        # Default activities are provisioned at registration; existing users are
+        # backfilled once with `flask --app run backfill-default-activities`
+
+    from app.commands import register_commands
+    register_commands(app)
 
     # Register blueprints WITH PROPER URL PREFIXES
     from app.routes.auth import bp as auth_bp
@@ -83,6 +103,22 @@ def create_app():
     except ImportError:
         print("⚠️ Notifications routes not found, skipping...")
 
+    # Per-user "today" schedule cache, kept current by the activity routes
+    from app.services.schedulecache import TodayScheduleCache
+    app.schedule_cache = TodayScheduleCache(app)
+
+    # Thumbnails and medium-size copies of uploaded photos, built in the background
+    from app.services.photovariants import PhotoVariantPipeline
+    app.photo_variants = PhotoVariantPipeline(app)
+
+    # Size-bounded disk cache behind /api/memories/photos/<filename>?w=&h=&fmt=
+    from app.services.resizecache import ResizeCache
+    app.resize_cache = ResizeCache(app)
+
+    # In-memory perceptual-hash index behind the duplicate and similar-photo lookups
+    from app.services.photohash import PhotoSimilarityIndex
+    app.photo_index = PhotoSimilarityIndex(app)
+
     # Initialize Notification Service
     from app.notificationservices import NotificationService
     notification_service = NotificationService(app)
@@ -100,6 +136,12 @@ def create_app():
             'cors_enabled': True
         })
 
+    # Prometheus metrics for the notification pipeline
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics_endpoint():
+        from app.services.metrics import registry
+        return registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
     # Test notification endpoint
     @app.route('/api/test-notification', methods=['POST'])
     def test_notification():
@@ -126,6 +168,7 @@ def create_app():
                 'family': '/api/family',
                 'activities': '/api/activities',
                 'health': '/api/health',
+                'metrics': '/api/metrics',
                 'test_notification': '/api/test-notification'
             }
         })
@@ -134,35 +177,3 @@ def create_app():
     print("🔔 Notification service started")
 
     return app
-
-def create_default_activities_for_all_users():
-    """Create default activities for all existing users"""
-    from app.models import User, UserActivity
-
-    users = User.query.all()
-    default_activities = [
-        {'activity_name': 'Morning Medication', 'scheduled_time': '09:00', 'days_of_week': '1,2,3,4,5,6,7'},
-        {'activity_name': 'Lunch with Family', 'scheduled_time': '12:00', 'days_of_week': '1,2,3,4,5,6,7'},
-        {'activity_name': 'Afternoon Rest', 'scheduled_time': '14:00', 'days_of_week': '1,2,3,4,5,6,7'},
-        {'activity_name': 'Evening Medication', 'scheduled_time': '18:00', 'days_of_week': '1,2,3,4,5,6,7'},
-        {'activity_name': 'Dinner with Family', 'scheduled_time': '19:00', 'days_of_week': '1,2,3,4,5,6,7'},
-    ]
-
-    for user in users:
-        existing_activities = UserActivity.query.filter_by(user_id=user.id).count()
-        if existing_activities == 0:
-            print(f"📝 Creating default activities for user: {user.name}")
-            for activity_data in default_activities:
-                activity = UserActivity(
-                    user_id=user.id,
-                    activity_name=activity_data['activity_name'],
-                    scheduled_time=activity_data['scheduled_time'],
-                    days_of_week=activity_data['days_of_week'],
-                    is_active=True
-                )
-                db.session.add(activity)
-        else:
-            print(f"✅ User {user.name} already has {existing_activities} activities")
-
-    db.session.commit()
-    print(f"✅ Created default activities for {len(users)} users")
\ No newline at end of file
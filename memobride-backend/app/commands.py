@@ -0,0 +1,66 @@
+# commands.py - one-off maintenance commands, run with `flask --app run <command>`
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('backfill-default-activities')
+@click.option('--batch-size', default=500, show_default=True, help='Users provisioned per transaction')
+@with_appcontext
+def backfill_default_activities_command(batch_size):
+    """Create the default activities for existing users that have none.
+
+    Running servers schedule alerts for them at their next scheduler resync.
+    """
+    from app.services.defaultactivities import backfill_default_activities
+
+    users, activities = backfill_default_activities(batch_size=batch_size)
+    click.echo(f"✅ Created {activities} default activities for {users} users")
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the plan of every query, not only failing ones')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Fail if an endpoint query shape no longer uses an index"""
+    from app.queryplans import check_query_plans
+
+    results = check_query_plans()
+    for name, ok, details, problems in results:
+        click.echo(f"{'✅' if ok else '❌'} {name}")
+        if verbose or not ok:
+            for detail in details:
+                click.echo(f"      {detail}")
+
+    failed = [name for name, ok, _, _ in results if not ok]
+    if failed:
+        raise click.ClickException(f"{len(failed)} of {len(results)} queries are not index-backed: {', '.join(failed)}")
+    click.echo(f"✅ All {len(results)} queries use indexes")
+
+
+@click.command('generate-photo-variants')
+@click.option('--retry-failed', is_flag=True, help='Also retry photos whose variants failed before')
+@with_appcontext
+def generate_photo_variants_command(retry_failed):
+    """Build thumbnails and medium variants for photos that have none"""
+    from app.services.photovariants import backfill_photo_variants
+
+    ready, failed = backfill_photo_variants(retry_failed=retry_failed)
+    click.echo(f"✅ Generated variants for {ready} photos" + (f", {failed} failed" if failed else ''))
+
+
+@click.command('hash-photos')
+@click.option('--batch-size', default=200, show_default=True, help='Photos hashed per transaction')
+@with_appcontext
+def hash_photos_command(batch_size):
+    """Compute perceptual hashes for photos uploaded before hashing existed"""
+    from app.services.photohash import backfill_photo_hashes
+
+    hashed, unreadable = backfill_photo_hashes(batch_size=batch_size)
+    click.echo(f"✅ Hashed {hashed} photos" + (f", {unreadable} unreadable" if unreadable else ''))
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_default_activities_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(generate_photo_variants_command)
+    app.cli.add_command(hash_photos_command)
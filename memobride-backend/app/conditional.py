@@ -0,0 +1,85 @@
+# conditional.py - ETags for per-user JSON endpoints
+#
+# Every user has a data_version counter. It is bumped in the same transaction
+# as any write to that user's data, so "version unchanged" means "response
+# unchanged" and a matching If-None-Match can be answered with 304 after a
+# single primary-key lookup, without running the view at all.
+from datetime import date
+from functools import wraps
+
+from flask import request, make_response
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+# ORM models whose rows belong to a user through user_id; writes to them bump the owner's version
+VERSIONED_MODELS = ('FamilyMember', 'UserActivity', 'MissedActivity', 'MemoryPhoto', 'GameSession')
+
+
+def bump_data_version(*user_ids):
+    """Bump data_version in the current transaction; needed after Core/bulk writes the ORM hook cannot see"""
+    from app.models import User
+
+    ids = {int(user_id) for user_id in user_ids if user_id is not None}
+    if ids:
+        db.session.execute(
+            db.update(User).where(User.id.in_(ids)).values(data_version=User.data_version + 1)
+        )
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changed_users(session, flush_context, instances):
+    changed = session.info.setdefault('changed_user_ids', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        name = type(instance).__name__
+        if name == 'User':
+            if instance.id is not None:
+                changed.add(instance.id)
+        elif name in VERSIONED_MODELS and getattr(instance, 'user_id', None) is not None:
+            changed.add(int(instance.user_id))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_changed_users(session, flush_context):
+    changed = session.info.pop('changed_user_ids', None)
+    if changed:
+        from app.models import User
+        table = User.__table__
+        session.connection().execute(
+            table.update().where(table.c.id.in_(changed)).values(data_version=table.c.data_version + 1)
+        )
+
+
+def current_data_version(user_id):
+    from app.models import User
+    return db.session.query(User.data_version).filter(User.id == int(user_id)).scalar()
+
+
+def etag_by_user_version(view):
+    """Weak ETag from the caller's data_version; 304 on If-None-Match without calling the view.
+
+    Use below @jwt_required(). Today's date is part of the tag because some
+    views (the today schedule) change at midnight without any write.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = get_jwt_identity()
+        version = current_data_version(user_id) if user_id is not None else None
+        if version is None:
+            return view(*args, **kwargs)
+
+        etag = f"u{user_id}-v{version}-{date.today().isoformat()}"
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return wrapper
@@ -0,0 +1,50 @@
+# dbhelpers.py - dialect-aware statements shared by routes and services
+from app import db
+
+
+def insert_ignoring_conflicts(model, index_elements):
+    """INSERT ... ON CONFLICT (index_elements) DO NOTHING for the current database.
+
+    Lets callers write idempotent rows in a single statement instead of a
+    check-then-insert round trip; the result's rowcount is 0 when the row
+    already existed.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    return insert(model).on_conflict_do_nothing(index_elements=index_elements)
+
+
+def upsert(model, index_elements, update_columns):
+    """INSERT ... ON CONFLICT (index_elements) DO UPDATE SET update_columns = excluded values.
+
+    Works with .values(...) and .from_select(...); re-running it over the same
+    keys overwrites the listed columns instead of adding rows.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(model)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: statement.excluded[column] for column in update_columns}
+    )
+
+
+def insert_or_increment(model, index_elements, counter):
+    """INSERT ... ON CONFLICT (index_elements) DO UPDATE SET counter = counter + 1.
+
+    One atomic statement for reference counts: the first writer inserts the
+    row with the counter it supplies, later ones bump the existing row.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    column = getattr(model, counter)
+    return insert(model).on_conflict_do_update(index_elements=index_elements, set_={counter: column + 1})
@@ -0,0 +1,191 @@
+# migrations.py - versioned schema changes applied at startup
+#
+# db.create_all() only creates missing tables, it never alters existing ones.
+# Column and index changes to tables that already hold data live here as
+# numbered steps. Applied versions are recorded in schema_migrations, and each
+# step also checks the live schema first, so it is safe to run on a database
+# that create_all() has just built with the new columns already in place.
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from app import db
+
+
+def _columns(table):
+    return {column['name'] for column in inspect(db.engine).get_columns(table)}
+
+
+def _indexes(table):
+    return {index['name']: index for index in inspect(db.engine).get_indexes(table)}
+
+
+def _create_index(name, table, columns, unique=False):
+    """CREATE [UNIQUE] INDEX IF NOT EXISTS; works on both SQLite and PostgreSQL"""
+    db.session.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+    db.session.commit()
+
+
+def add_activity_completion_completed_on():
+    """Stored completion day plus (activity_id, completed_on) index, backfilled from completed_at"""
+    if 'completed_on' not in _columns('activity_completion'):
+        db.session.execute(text('ALTER TABLE activity_completion ADD COLUMN completed_on DATE'))
+
+    backfilled = db.session.execute(text(
+        'UPDATE activity_completion SET completed_on = DATE(completed_at) '
+        'WHERE completed_on IS NULL AND completed_at IS NOT NULL'
+    )).rowcount
+    db.session.commit()
+
+    _create_index('ix_activity_completion_activity_completed_on', 'activity_completion',
+                  ['activity_id', 'completed_on'])
+    return f"backfilled {backfilled} completions"
+
+
+def unique_activity_completion_per_day():
+    """Make (activity_id, completed_on) unique, keeping the earliest of any duplicate completions"""
+    index = _indexes('activity_completion').get('ix_activity_completion_activity_completed_on')
+    if index and index['unique']:
+        return None
+
+    removed = db.session.execute(text(
+        'DELETE FROM activity_completion WHERE completed_on IS NOT NULL AND id NOT IN ('
+        'SELECT MIN(id) FROM activity_completion WHERE completed_on IS NOT NULL '
+        'GROUP BY activity_id, completed_on)'
+    )).rowcount
+    db.session.execute(text('DROP INDEX IF EXISTS ix_activity_completion_activity_completed_on'))
+    db.session.commit()
+
+    _create_index('ix_activity_completion_activity_completed_on', 'activity_completion',
+                  ['activity_id', 'completed_on'], unique=True)
+    return f"removed {removed} duplicate completions"
+
+
+def add_user_activity_days_mask():
+    """Weekday bitmask column, backfilled from the days_of_week strings"""
+    from app.services.activityscheduler import ALL_DAYS_MASK, days_to_mask
+
+    if 'days_mask' not in _columns('user_activity'):
+        db.session.execute(text(
+            f'ALTER TABLE user_activity ADD COLUMN days_mask INTEGER NOT NULL DEFAULT {ALL_DAYS_MASK}'
+        ))
+
+    # Only a handful of distinct schedules exist, so convert each string once
+    distinct = [row[0] for row in db.session.execute(text('SELECT DISTINCT days_of_week FROM user_activity'))]
+    for days_of_week in distinct:
+        if days_of_week is None:
+            db.session.execute(text(
+                f'UPDATE user_activity SET days_mask = {ALL_DAYS_MASK} WHERE days_of_week IS NULL'
+            ))
+            continue
+        db.session.execute(
+            text('UPDATE user_activity SET days_mask = :mask WHERE days_of_week = :days'),
+            {'mask': days_to_mask(days_of_week), 'days': days_of_week}
+        )
+    db.session.commit()
+    return f"converted {len(distinct)} distinct schedules"
+
+
+def add_keyset_pagination_indexes():
+    """(user_id, timestamp, id) indexes behind the paginated list endpoints"""
+    _create_index('ix_user_activity_user_created', 'user_activity', ['user_id', 'created_at', 'id'])
+    _create_index('ix_missed_activity_user_created', 'missed_activity', ['user_id', 'created_at', 'id'])
+    _create_index('ix_memory_photo_user_uploaded', 'memory_photo', ['user_id', 'uploaded_at', 'id'])
+    _create_index('ix_game_session_user_created', 'game_session', ['user_id', 'created_at', 'id'])
+    return None
+
+
+def add_user_data_version():
+    """Per-user data_version counter used for ETags"""
+    if 'data_version' not in _columns('user'):
+        db.session.execute(text('ALTER TABLE "user" ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0'))
+        db.session.commit()
+    return None
+
+
+def add_foreign_key_indexes():
+    """Indexes for the remaining per-user lookups, shaped like the queries that use them"""
+    _create_index('ix_family_member_user', 'family_member', ['user_id'])
+    _create_index('ix_user_activity_user_name', 'user_activity', ['user_id', 'activity_name'])
+    _create_index('ix_user_activity_scheduled_time', 'user_activity', ['scheduled_time'])
+    _create_index('ix_game_session_user_type_created', 'game_session', ['user_id', 'game_type', 'created_at'])
+    return None
+
+
+def add_memory_photo_variants():
+    """Columns recording the resized variants of each photo"""
+    columns = _columns('memory_photo')
+    if 'variants' not in columns:
+        db.session.execute(text('ALTER TABLE memory_photo ADD COLUMN variants JSON'))
+    if 'variants_status' not in columns:
+        db.session.execute(text('ALTER TABLE memory_photo ADD COLUMN variants_status VARCHAR(20)'))
+    db.session.commit()
+    return "existing photos get variants with `flask --app run generate-photo-variants`"
+
+
+def add_memory_photo_blob_id():
+    """Link photos to their per-user blob; older uploads keep their own file and no blob"""
+    if 'blob_id' not in _columns('memory_photo'):
+        db.session.execute(text('ALTER TABLE memory_photo ADD COLUMN blob_id INTEGER REFERENCES photo_blob (id)'))
+        db.session.commit()
+    _create_index('ix_memory_photo_blob', 'memory_photo', ['blob_id'])
+    return None
+
+
+def add_memory_photo_dhash():
+    """Perceptual hash column for near-duplicate lookups"""
+    if 'dhash' not in _columns('memory_photo'):
+        db.session.execute(text('ALTER TABLE memory_photo ADD COLUMN dhash BIGINT'))
+        db.session.commit()
+    return "existing photos are hashed with `flask --app run hash-photos`"
+
+
+def add_user_photo_version():
+    """Per-user photo_version counter used by the similarity index"""
+    if 'photo_version' not in _columns('user'):
+        db.session.execute(text('ALTER TABLE "user" ADD COLUMN photo_version INTEGER NOT NULL DEFAULT 0'))
+        db.session.commit()
+    return None
+
+
+# (version, step) in the order they must run; never renumber or reorder
+MIGRATIONS = [
+    (1, add_activity_completion_completed_on),
+    (2, unique_activity_completion_per_day),
+    (3, add_user_activity_days_mask),
+    (4, add_keyset_pagination_indexes),
+    (5, add_user_data_version),
+    (6, add_foreign_key_indexes),
+    (7, add_memory_photo_variants),
+    (8, add_memory_photo_blob_id),
+    (9, add_memory_photo_dhash),
+    (10, add_user_photo_version),
+]
+
+
+def run_migrations():
+    """Apply every migration newer than the recorded schema version"""
+    db.session.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+    db.session.commit()
+
+    applied = {row[0] for row in db.session.execute(text('SELECT version FROM schema_migrations'))}
+    for version, step in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            result = step()
+            db.session.execute(
+                text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+                {'version': version, 'name': step.__name__, 'applied_at': datetime.utcnow()}
+            )
+            db.session.commit()
+            print(f"🛠️ Applied migration {version} {step.__name__}" + (f": {result}" if result else ''))
+        except Exception:
+            db.session.rollback()
+            print(f"❌ Migration {version} {step.__name__} failed")
+            raise
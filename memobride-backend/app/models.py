@@ -1,6 +1,8 @@
 from app import db
-from datetime import datetime
+from datetime import datetime, date
 from app import bcrypt
+from sqlalchemy.orm import validates
+from app.services.activityscheduler import ALL_DAYS_MASK, days_to_mask
 
 
 class User(db.Model):
@@ -10,6 +12,10 @@ class User(db.Model):
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every write to this user's data; the source of the API's ETags
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped when one of the user's photo hashes appears or goes; keys the similarity index
+    photo_version = db.Column(db.Integer, nullable=False, default=0)
 
     # Relationship with family members
     family_members = db.relationship('FamilyMember', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -45,6 +51,10 @@ class FamilyMember(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     receive_notifications = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (
+        db.Index('ix_family_member_user', 'user_id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -66,9 +76,26 @@ class UserActivity(db.Model):
     activity_name = db.Column(db.String(100), nullable=False)
     scheduled_time = db.Column(db.String(20), nullable=False)  # "09:00"
     days_of_week = db.Column(db.String(50), default='1,2,3,4,5,6,7')  # 1=Monday, 7=Sunday
+    # Same schedule as a bitmask (bit 0 = Monday) so "scheduled today" is a SQL predicate
+    days_mask = db.Column(db.Integer, default=ALL_DAYS_MASK, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Keyset pagination of a user's activities
+        db.Index('ix_user_activity_user_created', 'user_id', 'created_at', 'id'),
+        # Completion by activity name
+        db.Index('ix_user_activity_user_name', 'user_id', 'activity_name'),
+        # Missed-activity sweep: alert windows are ranges of scheduled_time
+        db.Index('ix_user_activity_scheduled_time', 'scheduled_time'),
+    )
+
+    @validates('days_of_week')
+    def _sync_days_mask(self, key, value):
+        """Keep days_mask in step whenever days_of_week is assigned"""
+        self.days_mask = days_to_mask(value)
+        return value
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -76,6 +103,7 @@ class UserActivity(db.Model):
             'activity_name': self.activity_name,
             'scheduled_time': self.scheduled_time,
             'days_of_week': self.days_of_week,
+            'days_mask': self.days_mask,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -85,13 +113,21 @@ class ActivityCompletion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     activity_id = db.Column(db.Integer, db.ForeignKey('user_activity.id'), nullable=False)
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Day the completion counts for, stored so "completed today" lookups can use an index
+    completed_on = db.Column(db.Date, default=date.today)
     completed_by_user = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (
+        # Unique: one completion per activity and day, so repeats can be ignored on insert
+        db.Index('ix_activity_completion_activity_completed_on', 'activity_id', 'completed_on', unique=True),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
             'activity_id': self.activity_id,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'completed_on': self.completed_on.isoformat() if self.completed_on else None,
             'completed_by_user': self.completed_by_user
         }
 
@@ -107,6 +143,10 @@ class MissedActivity(db.Model):
 
     user = db.relationship('User', backref='missed_activities')
 
+    __table_args__ = (
+        db.Index('ix_missed_activity_user_created', 'user_id', 'created_at', 'id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -119,14 +159,59 @@ class MissedActivity(db.Model):
         }
 
 
+class PhotoBlob(db.Model):
+    """One stored image file of one user, shared by that user's identical uploads.
+
+    The SHA-256 of the bytes is only the lookup key; the file gets a random
+    name, because photo URLs are served without a login.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # MemoryPhoto rows pointing here
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_photo_blob_user_sha256', 'user_id', 'sha256', unique=True),
+    )
+
+
 class MemoryPhoto(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     category = db.Column(db.String(50), nullable=False, default='family')
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)  # the blob's file; NULL blob_id for pre-dedup uploads
+    blob_id = db.Column(db.Integer, db.ForeignKey('photo_blob.id'))
     original_filename = db.Column(db.String(255), nullable=False)
     description = db.Column(db.String(200), nullable=False, default='Memory Photo')
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Resized copies, filled in by the background variant pipeline:
+    # {'thumb': {'width': 256, 'height': 256, 'webp': filename, 'jpeg': filename}, 'medium': {...}}
+    variants = db.Column(db.JSON)
+    variants_status = db.Column(db.String(20))  # pending, ready, failed
+    dhash = db.Column(db.BigInteger)  # 64-bit perceptual hash, stored signed
+
+    __table_args__ = (
+        db.Index('ix_memory_photo_user_uploaded', 'user_id', 'uploaded_at', 'id'),
+        db.Index('ix_memory_photo_blob', 'blob_id'),
+    )
+
+    @staticmethod
+    def photo_url(filename):
+        # Use absolute URL for images
+        return f'http://localhost:5000/api/memories/photos/{filename}'
+
+    def variant_urls(self):
+        """{size: {width, height, webp, jpeg}} with URLs, or None until the variants exist"""
+        if self.variants_status != 'ready' or not self.variants:
+            return None
+        return {
+            size: {key: self.photo_url(value) if key not in ('width', 'height') else value
+                   for key, value in variant.items()}
+            for size, variant in self.variants.items()
+        }
 
     def to_dict(self):
         return {
@@ -136,8 +221,9 @@ class MemoryPhoto(db.Model):
             'filename': self.filename,
             'original_filename': self.original_filename,
             'description': self.description,
-            # Use absolute URL for images
-            'url': f'http://localhost:5000/api/memories/photos/{self.filename}',
+            'url': self.photo_url(self.filename),
+            'variants': self.variant_urls(),
+            'variants_status': self.variants_status,
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None
         }
 
@@ -153,6 +239,12 @@ class GameSession(db.Model):
 
     user = db.relationship('User', backref=db.backref('game_sessions', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_game_session_user_created', 'user_id', 'created_at', 'id'),
+        # Per-game stats and resets
+        db.Index('ix_game_session_user_type_created', 'user_id', 'game_type', 'created_at'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -161,4 +253,116 @@ class GameSession(db.Model):
             'score': self.score,
             'moves': self.moves,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class NotificationOutbox(db.Model):
+    """Durable queue of outgoing notification emails, one row per idempotency key"""
+    id = db.Column(db.Integer, primary_key=True)
+    # "<user_id>:<activity_id>:<date>:<channel>" - unique, so dedup is an index lookup
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    activity_id = db.Column(db.Integer, db.ForeignKey('user_activity.id'))
+    activity_date = db.Column(db.Date)
+    channel = db.Column(db.String(50), nullable=False)  # 'user' or 'family:<member id>'
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body_text = db.Column(db.Text, nullable=False)
+    body_html = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_notification_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'activity_id': self.activity_id,
+            'activity_date': self.activity_date.isoformat() if self.activity_date else None,
+            'channel': self.channel,
+            'recipient': self.recipient,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+
+class ServiceLease(db.Model):
+    """Named lease row so only one process runs a singleton background service"""
+    name = db.Column(db.String(100), primary_key=True)
+    holder = db.Column(db.String(200))
+    expires_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'holder': self.holder,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None
+        }
+
+
+class DailyAdherence(db.Model):
+    """Nightly rollup: whether one activity was scheduled and completed on one day"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    activity_id = db.Column(db.Integer, db.ForeignKey('user_activity.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    scheduled = db.Column(db.Boolean, nullable=False, default=True)
+    completed = db.Column(db.Boolean, nullable=False, default=False)
+    is_medication = db.Column(db.Boolean, nullable=False, default=False)
+    rolled_up_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_daily_adherence_activity_day', 'activity_id', 'day', unique=True),
+        db.Index('ix_daily_adherence_user_day', 'user_id', 'day'),
+    )
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'activity_id': self.activity_id,
+            'day': self.day.isoformat() if self.day else None,
+            'scheduled': self.scheduled,
+            'completed': self.completed,
+            'is_medication': self.is_medication
+        }
+
+
+class BackgroundJob(db.Model):
+    """Status of one job run by a JobRunner, readable from any worker process"""
+    id = db.Column(db.String(32), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    owner_id = db.Column(db.String(50))
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    result = db.Column(db.JSON)
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_background_job_created', 'created_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'owner_id': self.owner_id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -1,12 +1,13 @@
 # notificationservices.py - FIXED IMPORT CONFLICT
 import os
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta, time as dt_time  # FIXED: Rename time import
+from datetime import datetime
 import threading
 import time as time_module  # FIXED: Rename time module import
-from flask import current_app
+from flask import current_app, has_app_context
+
+from app.services import metrics
 
 
 class NotificationService:
@@ -21,36 +22,89 @@ class NotificationService:
             'username': os.environ.get('SMTP_USERNAME', ''),
             'password': os.environ.get('SMTP_PASSWORD', ''),
             'from_email': os.environ.get('FROM_EMAIL', ''),
-            'from_name': os.environ.get('FROM_NAME', 'Memobridge Care Team')
+            'from_name': os.environ.get('FROM_NAME', 'Memobridge Care Team'),
+            'use_tls': os.environ.get('SMTP_USE_TLS', 'true').lower() != 'false',
+            'timeout': int(os.environ.get('SMTP_TIMEOUT', 30))
         }
 
-        # Track notified activities to avoid duplicates
-        self.notified_activities = set()
-
-    def send_email(self, to_email, subject, message, html_message=None):
-        """Send email notification using SMTP"""
+        # Email bodies come from templates compiled once here
+        from app.services.emailtemplates import EmailTemplates
+        self.templates = EmailTemplates()
+
+        # Outbound mail goes through a pooled queue so slow SMTP never blocks callers
+        from app.services.mailqueue import MailQueue
+        self.mail_queue = MailQueue(
+            self.smtp_config,
+            workers=int(os.environ.get('SMTP_WORKERS', 2)),
+            max_queue_size=int(os.environ.get('SMTP_QUEUE_SIZE', 1000)),
+            batch_size=int(os.environ.get('SMTP_BATCH_SIZE', 20))
+        )
+
+        # Non-critical family alerts are coalesced per member into one email per window
+        self.family_digest_minutes = int(os.environ.get('FAMILY_DIGEST_WINDOW_MINUTES', 15))
+
+        # Sharded full sweeps: users are split by user_id % shards across a thread pool
+        self.sweep_shards = int(os.environ.get('NOTIFICATION_SWEEP_SHARDS', 1))
+        self.sweep_workers = int(os.environ.get('NOTIFICATION_SWEEP_WORKERS', 4))
+        self.last_sweep = None
+        # The leader re-runs a full sweep this often (0 disables it) to catch alerts
+        # the scheduler missed, e.g. activities added by another process before its resync
+        self.sweep_interval_seconds = int(os.environ.get('NOTIFICATION_SWEEP_INTERVAL_SECONDS', 300))
+        self._sweep_thread = None
+        self._sweep_wakeup = threading.Event()
+
+        # Bounded pool for checks that must not block request handlers
+        from app.services.jobrunner import JobRunner
+        self.jobs = JobRunner(app, max_workers=int(os.environ.get('NOTIFICATION_JOB_WORKERS', 4)))
+
+        # Durable outbox: dedup by idempotency key, retries with backoff
+        from app.services.notificationoutbox import OutboxDrainer
+        self.outbox = OutboxDrainer(app, self)
+
+        # Scrape-time gauges
+        metrics.mail_queue_depth.set_function(self.mail_queue.qsize)
+        metrics.outbox_pending.set_function(self.outbox.pending_count)
+
+        # Only the process holding this lease runs the scheduler and outbox drain
+        from app.services.leaderlease import LeaderLease
+        self.monitor_lease = LeaderLease(app, 'notification-monitor')
+        self.is_leader = False
+        self._monitor_wakeup = threading.Event()
+        self._monitor_thread = None
+
+        # Due-time scheduler that drives the background alerts
+        from app.services.activityscheduler import ActivityScheduler
+        self.scheduler = ActivityScheduler(self)
+
+        # Nightly adherence rollup, also leader-only so each day is rolled up once
+        from app.services.adherencerollup import AdherenceRollup
+        self.rollup = AdherenceRollup(app)
+
+    def build_email(self, to_email, subject, message, html_message=None):
+        """Build the MIME message for a notification"""
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = f"{self.smtp_config['from_name']} <{self.smtp_config['from_email']}>"
+        msg['To'] = to_email
+
+        # Create the plain-text and HTML version (utf-8 up front, templates contain emoji)
+        text_part = MIMEText(message, 'plain', 'utf-8')
+        msg.attach(text_part)
+
+        if html_message:
+            html_part = MIMEText(html_message, 'html', 'utf-8')
+            msg.attach(html_part)
+
+        return msg
+
+    def send_email(self, to_email, subject, message, html_message=None, on_result=None):
+        """Queue an email notification for SMTP delivery; returns True once accepted"""
         try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = f"{self.smtp_config['from_name']} <{self.smtp_config['from_email']}>"
-            msg['To'] = to_email
-
-            # Create the plain-text and HTML version
-            text_part = MIMEText(message, 'plain')
-            msg.attach(text_part)
-
-            if html_message:
-                html_part = MIMEText(html_message, 'html')
-                msg.attach(html_part)
-
-            # Send the email
-            with smtplib.SMTP(self.smtp_config['server'], self.smtp_config['port']) as server:
-                server.starttls()
-                server.login(self.smtp_config['username'], self.smtp_config['password'])
-                server.send_message(msg)
-
-            print(f"✅ Email sent to: {to_email}")
+            msg = self.build_email(to_email, subject, message, html_message)
+            if not self.mail_queue.enqueue(msg, on_result):
+                return False
+
+            print(f"📨 Email queued for: {to_email}")
             return True
 
         except Exception as e:
@@ -62,49 +116,34 @@ class NotificationService:
         if not family_member.email:
             return False
 
-        subject = "👨‍👩‍👧‍👦 Welcome to Memobridge!"
-
-        html_message = f"""
-        <h2>Hello {family_member.name},</h2>
-        <p>You've been added as a family member to <strong>{user.name}'s</strong> Memobridge care account.</p>
-        <p>You will receive notifications about important activities and well-being updates.</p>
-        <p>Thank you for being part of {user.name}'s care team!</p>
-        """
-
-        plain_message = f"""
-        Hello {family_member.name},
-        You've been added as a family member to {user.name}'s Memobridge care account.
-        You will receive notifications about important activities.
-        Thank you!
-        """
-
+        subject, plain_message, html_message = self.templates.render(
+            'welcome', family_member=family_member, user=user)
         return self.send_email(family_member.email, subject, plain_message, html_message)
 
+    def compose_missed_activity_alert_to_family(self, user, family_member, activity_name, scheduled_time, importance):
+        """Build (subject, plain, html) for a family missed activity alert"""
+        return self.templates.render(
+            'family_alert', user=user, family_member=family_member,
+            activity_name=activity_name, scheduled_time=scheduled_time, importance=importance)
+
     def send_missed_activity_alert_to_family(self, user, family_member, activity_name, scheduled_time, importance):
         """Send missed activity alert to family member"""
         if not family_member.email:
             return False
 
-        subject = f"🚨 Memobridge Alert: {user.name} missed {activity_name}"
-
-        html_message = f"""
-        <h2>Hello {family_member.name},</h2>
-        <p><strong>{user.name}</strong> has missed an important activity:</p>
-        <ul>
-            <li>Activity: {activity_name}</li>
-            <li>Scheduled Time: {scheduled_time}</li>
-            <li>Importance: {importance.upper()}</li>
-        </ul>
-        <p>Please check on them to ensure their well-being.</p>
-        """
+        subject, plain_message, html_message = self.compose_missed_activity_alert_to_family(
+            user, family_member, activity_name, scheduled_time, importance)
+        return self.send_email(family_member.email, subject, plain_message, html_message)
 
-        plain_message = f"""
-        Alert: {user.name} missed {activity_name} at {scheduled_time}
-        Importance: {importance}
-        Please check on them.
-        """
+    def compose_family_digest(self, user, family_member, items):
+        """Build (subject, plain, html) for one email listing several missed activities"""
+        return self.templates.render('family_digest', user=user, family_member=family_member, items=items)
 
-        return self.send_email(family_member.email, subject, plain_message, html_message)
+    def compose_missed_activity_alert_to_user(self, user, activity_name, scheduled_time, importance):
+        """Build (subject, plain, html) for the user's own missed activity reminder"""
+        return self.templates.render(
+            'user_alert', user=user,
+            activity_name=activity_name, scheduled_time=scheduled_time, importance=importance)
 
     def send_missed_activity_alert_to_user(self, user, activity_name, scheduled_time, importance):
         """Send missed activity alert to the user themselves"""
@@ -112,259 +151,432 @@ class NotificationService:
             print(f"⚠️ User {user.name} has no email address, cannot send notification")
             return False
 
-        subject = f"🔔 Memobridge Reminder: You missed {activity_name}"
-
-        html_message = f"""
-        <h2>Hello {user.name},</h2>
-        <p>We noticed you missed an important activity:</p>
-        <ul>
-            <li>Activity: {activity_name}</li>
-            <li>Scheduled Time: {scheduled_time}</li>
-            <li>Importance: {importance.upper()}</li>
-        </ul>
-        <p>Please try to complete this activity as soon as possible.</p>
-        <p>If you have already completed it, you can mark it as completed in the app.</p>
-        <p><strong>Memobridge Care Team</strong></p>
-        """
+        subject, plain_message, html_message = self.compose_missed_activity_alert_to_user(
+            user, activity_name, scheduled_time, importance)
 
-        plain_message = f"""
-        Hello {user.name},
-        We noticed you missed an important activity:
-        Activity: {activity_name}
-        Scheduled Time: {scheduled_time}
-        Importance: {importance}
+        print(f"📧 Attempting to send user notification to: {user.email}")
+        return self.send_email(user.email, subject, plain_message, html_message)
 
-        Please try to complete this activity as soon as possible.
-        If you have already completed it, you can mark it as completed in the app.
+    def notify_family_members(self, user_id, activity_name, scheduled_time, importance,
+                              user=None, family_members=None, activity_id=None, activity_date=None, commit=True):
+        """Queue a missed activity alert in the outbox for every family member.
 
-        Memobridge Care Team
+        Batch callers pass commit=False: the rows join their transaction and
+        errors propagate, so the whole batch commits or rolls back together.
         """
+        if not has_app_context():
+            with self.app.app_context():
+                return self.notify_family_members(user_id, activity_name, scheduled_time, importance,
+                                                  user, family_members, activity_id, activity_date, commit)
 
-        print(f"📧 Attempting to send user notification to: {user.email}")
-        return self.send_email(user.email, subject, plain_message, html_message)
-
-    def notify_family_members(self, user_id, activity_name, scheduled_time, importance):
-        """Notify all family members about missed activity"""
         try:
-            with self.app.app_context():
-                from app.models import User, FamilyMember
+            from app.models import User, FamilyMember, UserActivity
+            from app.services.notificationoutbox import add_to_outbox, digest_window_end, DIGEST_CHANNEL_PREFIX
+            from app import db
 
+            if user is None:
                 user = User.query.get(user_id)
-                if not user:
-                    print(f"❌ User {user_id} not found for family notification")
-                    return 0
+            if not user:
+                print(f"❌ User {user_id} not found for family notification")
+                return 0
 
+            # Batch callers pass the members they already loaded
+            if family_members is None:
                 family_members = FamilyMember.query.filter_by(
                     user_id=user_id,
                     receive_notifications=True
                 ).all()
 
-                print(f"🔍 Found {len(family_members)} family members to notify for user {user_id}")
-
-                notifications_sent = 0
-                for member in family_members:
-                    if member.email:
-                        print(f"📧 Sending notification to family member: {member.name} ({member.email})")
-                        if self.send_missed_activity_alert_to_family(user, member, activity_name, scheduled_time,
-                                                                     importance):
-                            notifications_sent += 1
-                            print(f"✅ Family notification sent to {member.email}")
-                        else:
-                            print(f"❌ Failed to send family notification to {member.email}")
+            print(f"🔍 Found {len(family_members)} family members to notify for user {user_id}")
+
+            # The outbox key is per activity, resolve it for callers that only know the name
+            if activity_id is None:
+                activity = UserActivity.query.filter_by(user_id=user.id, activity_name=activity_name).first()
+                activity_id = activity.id if activity else None
+
+            # Critical alerts go out immediately; the rest wait for the window digest
+            if importance == 'critical':
+                channel_prefix, send_after = 'family:', None
+            else:
+                channel_prefix = DIGEST_CHANNEL_PREFIX
+                send_after = digest_window_end(datetime.utcnow(), self.family_digest_minutes)
+
+            activity_date = activity_date or datetime.now().date()
+            notifications_sent = 0
+            for member in family_members:
+                if member.email:
+                    subject, plain_message, html_message = self.compose_missed_activity_alert_to_family(
+                        user, member, activity_name, scheduled_time, importance)
+                    if add_to_outbox(user.id, activity_id, activity_date, f"{channel_prefix}{member.id}",
+                                     member.email, subject, plain_message, html_message, send_after=send_after):
+                        notifications_sent += 1
+                        print(f"📬 Family notification queued for {member.name} ({member.email})")
                     else:
-                        print(f"⚠️ Family member {member.name} has no email, skipping")
+                        print(f"⏭️ Family notification already queued for {member.email}")
+                else:
+                    print(f"⚠️ Family member {member.name} has no email, skipping")
 
-                print(f"📊 Total family notifications sent: {notifications_sent}")
-                return notifications_sent
+            if commit:
+                db.session.commit()
+                self.outbox.wake()
+            print(f"📊 Total family notifications queued: {notifications_sent}")
+            return notifications_sent
 
         except Exception as e:
             print(f"❌ Error in notify_family_members: {e}")
+            if not commit:
+                raise
             return 0
 
-    def check_missed_activities_for_user(self, user_id, force_notify=False):
-        """Check for missed activities for a specific user - USES ACTUAL USER ACTIVITIES"""
-        try:
-            with self.app.app_context():
-                from app.models import User, UserActivity, ActivityCompletion, MissedActivity
-                from app import db
+    def alert_user_of_missed_activity(self, user, activity, activity_date):
+        """Queue the user reminder for one missed activity and record it, once per day"""
+        from app.models import MissedActivity
+        from app.services.notificationoutbox import add_to_outbox
+        from app import db
 
-                user = User.query.get(user_id)
-                if not user:
-                    print(f"❌ User {user_id} not found")
-                    return 0
-
-                current_time = datetime.now()
-                today = current_time.date()
-                current_weekday = current_time.isoweekday()  # Monday=1, Sunday=7
-                notifications_sent = 0
-
-                print(f"🔔 Checking missed activities for user: {user.name} (ID: {user_id})")
+        if not user.email:
+            print(f"⚠️ User {user.name} has no email address, cannot send notification")
+            return 0
 
-                # Get user's actual activities instead of hardcoded ones
-                user_activities = UserActivity.query.filter_by(
-                    user_id=user_id,
-                    is_active=True
-                ).all()
+        subject, plain_message, html_message = self.compose_missed_activity_alert_to_user(
+            user,
+            activity.activity_name,
+            activity.scheduled_time,
+            'high'  # Default importance
+        )
+        if not add_to_outbox(user.id, activity.id, activity_date, 'user',
+                             user.email, subject, plain_message, html_message):
+            # Already queued for this activity today (possibly by another worker)
+            return 0
 
-                if not user_activities:
-                    print(f"⚠️ No activities found for user {user.name}")
-                    return 0
+        print(f"📬 User notification queued for {activity.activity_name}")
+
+        # Record missed activity
+        missed_activity = MissedActivity(
+            user_id=user.id,
+            activity_name=activity.activity_name,
+            scheduled_time=activity.scheduled_time,
+            importance='high',
+            notified=True
+        )
+        db.session.add(missed_activity)
+        return 1
+
+    def alert_family_of_missed_activity(self, user, activity, activity_date, family_members=None):
+        """Queue the family alerts for one missed activity, once per member per day; the caller commits"""
+        print(f"📧 Queueing family notifications for {activity.activity_name}")
+        family_notifications = self.notify_family_members(
+            user.id,
+            activity.activity_name,
+            activity.scheduled_time,
+            'high',
+            user=user,
+            family_members=family_members,
+            activity_id=activity.id,
+            activity_date=activity_date,
+            commit=False
+        )
+        if not family_notifications:
+            print(f"⏭️ No new family notifications for {activity.activity_name}")
+        return family_notifications
+
+    def process_due_activity_events(self, events):
+        """Evaluate only the activities whose alert instant has arrived"""
+        from app.services.activityscheduler import USER_ALERT, FAMILY_ALERT
 
-                print(f"📋 Found {len(user_activities)} activities for user {user.name}")
+        try:
+            with metrics.sweep_duration.time(kind='scheduler'), metrics.count_queries() as queries, \
+                    self.app.app_context():
+                from app.models import User, UserActivity
+                from app.services.missedactivities import completed_activity_ids_query
+                from app import db
 
-                for activity in user_activities:
-                    # Check if activity is scheduled for today
-                    days_list = [int(day.strip()) for day in activity.days_of_week.split(',')]
-                    if current_weekday not in days_list:
-                        print(f"⏭️ Activity {activity.activity_name} not scheduled for today (day {current_weekday})")
-                        continue
+                metrics.activities_evaluated.inc(len(events), kind='scheduler')
+                activity_ids = {event.activity_id for event in events}
+                activities = {
+                    activity.id: activity
+                    for activity in UserActivity.query.filter(
+                        UserActivity.id.in_(activity_ids),
+                        UserActivity.is_active == True
+                    ).all()
+                }
+                users = {
+                    user.id: user
+                    for user in User.query.filter(
+                        User.id.in_({activity.user_id for activity in activities.values()})
+                    ).all()
+                }
+
+                # One completion lookup for the whole batch, per occurrence date
+                completed = set()
+                for occurs_on in {event.occurs_on for event in events}:
+                    rows = completed_activity_ids_query(activity_ids, occurs_on).all()
+                    completed.update((row.activity_id, occurs_on) for row in rows)
 
-                    # Parse scheduled time
-                    try:
-                        scheduled_hour, scheduled_minute = map(int, activity.scheduled_time.split(':'))
-                        scheduled_time_obj = dt_time(scheduled_hour, scheduled_minute)  # FIXED: Use dt_time
-                    except ValueError:
-                        print(f"❌ Invalid time format for activity {activity.activity_name}: {activity.scheduled_time}")
+                notifications_sent = 0
+                for event in events:
+                    activity = activities.get(event.activity_id)
+                    user = users.get(event.user_id)
+                    if not activity or not user or (event.activity_id, event.occurs_on) in completed:
                         continue
 
-                    # Create scheduled datetime for today
-                    scheduled_datetime = datetime.combine(today, scheduled_time_obj)
-
-                    # Check if activity was completed today
-                    activity_completed = ActivityCompletion.query.filter(
-                        ActivityCompletion.activity_id == activity.id,
-                        db.func.date(ActivityCompletion.completed_at) == today
-                    ).first()
-
-                    if not activity_completed:
-                        print(f"❌ Activity not completed: {activity.activity_name} at {activity.scheduled_time}")
-
-                        # Calculate time differences
-                        time_since_scheduled = current_time - scheduled_datetime
-
-                        # Create unique identifier for this notification
-                        notification_id = f"{user_id}_{activity.activity_name}_{today}"
-
-                        # USER NOTIFICATION: Within 20 minutes OR on login (force_notify)
-                        should_notify_user = (
-                                force_notify or
-                                (timedelta(minutes=1) <= time_since_scheduled <= timedelta(minutes=20))
-                        )
-
-                        if should_notify_user and notification_id not in self.notified_activities:
-                            print(f"📧 Sending user notification for {activity.activity_name}")
-                            if self.send_missed_activity_alert_to_user(
-                                    user,
-                                    activity.activity_name,
-                                    activity.scheduled_time,
-                                    'high'  # Default importance
-                            ):
-                                notifications_sent += 1
-                                self.notified_activities.add(notification_id)
-                                print(f"✅ User notification sent for {activity.activity_name}")
-
-                                # Record missed activity
-                                missed_activity = MissedActivity(
-                                    user_id=user.id,
-                                    activity_name=activity.activity_name,
-                                    scheduled_time=activity.scheduled_time,
-                                    importance='high',
-                                    notified=True
-                                )
-                                db.session.add(missed_activity)
-                            else:
-                                print(f"❌ Failed to send user notification for {activity.activity_name}")
-
-                        # FAMILY NOTIFICATION: After 30 minutes (only if not forced)
-                        elif (not force_notify and
-                              timedelta(minutes=30) <= time_since_scheduled <= timedelta(minutes=40) and
-                              f"{notification_id}_family" not in self.notified_activities):
-
-                            print(f"📧 Sending family notifications for {activity.activity_name}")
-                            family_notifications = self.notify_family_members(
-                                user.id,
-                                activity.activity_name,
-                                activity.scheduled_time,
-                                'high'
-                            )
-                            notifications_sent += family_notifications
-                            if family_notifications > 0:
-                                self.notified_activities.add(f"{notification_id}_family")
-                                print(f"✅ Family notifications sent for {activity.activity_name}")
-                            else:
-                                print(f"❌ No family notifications sent for {activity.activity_name}")
-                        else:
-                            time_diff_minutes = time_since_scheduled.total_seconds() / 60
-                            print(
-                                f"⏰ Activity {activity.activity_name} outside notification windows (diff: {time_diff_minutes:.1f} min)")
-                    else:
-                        print(f"✅ Activity completed: {activity.activity_name}")
+                    print(f"⏰ {event.kind} due for {activity.activity_name} (user {user.id})")
+                    if event.kind == USER_ALERT:
+                        notifications_sent += self.alert_user_of_missed_activity(user, activity, event.occurs_on)
+                    elif event.kind == FAMILY_ALERT:
+                        notifications_sent += self.alert_family_of_missed_activity(user, activity, event.occurs_on)
 
                 db.session.commit()
-                print(f"📊 Total notifications sent for user {user_id}: {notifications_sent}")
-                return notifications_sent
+            metrics.sweep_queries.observe(queries[0], kind='scheduler')
+            self.outbox.wake()
+            return notifications_sent
 
+        except Exception as e:
+            print(f"❌ Error in process_due_activity_events: {e}")
+            return 0
+
+    def activity_changed(self, activity):
+        """Keep the scheduler in step with a created or edited activity"""
+        self.scheduler.activity_changed(activity)
+
+    def completion_recorded(self, activity_id, completed_on):
+        """Tell the scheduler an activity no longer needs alerts today"""
+        self.scheduler.completion_recorded(activity_id, completed_on)
+
+    def apply_missed_activity_decisions(self, rows):
+        """Send the alerts for a batch of due-but-incomplete activities"""
+        from app.models import FamilyMember
+        from app.services.activityscheduler import USER_ALERT
+        from app import db
+
+        # Load the family of every user that reached the family stage in one query
+        family_user_ids = {row.user.id for row in rows if row.stage != USER_ALERT}
+        family_by_user = {}
+        if family_user_ids:
+            members = FamilyMember.query.filter(
+                FamilyMember.user_id.in_(family_user_ids),
+                FamilyMember.receive_notifications == True
+            ).all()
+            for member in members:
+                family_by_user.setdefault(member.user_id, []).append(member)
+
+        notifications_sent = 0
+        for row in rows:
+            print(f"❌ Activity not completed: {row.activity.activity_name} at {row.activity.scheduled_time}")
+            if row.stage == USER_ALERT:
+                notifications_sent += self.alert_user_of_missed_activity(
+                    row.user, row.activity, row.scheduled_at.date())
+            else:
+                notifications_sent += self.alert_family_of_missed_activity(
+                    row.user, row.activity, row.scheduled_at.date(),
+                    family_members=family_by_user.get(row.user.id, [])
+                )
+
+        db.session.commit()
+        self.outbox.wake()
+        return notifications_sent
+
+    def evaluate_user_missed_activities(self, user_id, force_notify=False):
+        """Alert on one user's due-but-incomplete activities; errors propagate to the caller"""
+        with self.app.app_context():
+            from app.models import User
+            from app.services.missedactivities import find_due_incomplete_activities
+
+            user = User.query.get(user_id)
+            if not user:
+                print(f"❌ User {user_id} not found")
+                return 0
+
+            print(f"🔔 Checking missed activities for user: {user.name} (ID: {user_id})")
+
+            with metrics.user_evaluation_duration.time():
+                rows = find_due_incomplete_activities(user_ids=[user.id], force_notify=force_notify)
+                notifications_sent = self.apply_missed_activity_decisions(rows)
+
+            print(f"📊 Total notifications sent for user {user_id}: {notifications_sent}")
+            return notifications_sent
+
+    def check_missed_activities_for_user(self, user_id, force_notify=False):
+        """Check for missed activities for a specific user - USES ACTUAL USER ACTIVITIES"""
+        try:
+            return self.evaluate_user_missed_activities(user_id, force_notify=force_notify)
         except Exception as e:
             print(f"❌ Error in check_missed_activities_for_user: {e}")
             import traceback
             traceback.print_exc()
             return 0
 
-    def check_and_notify_missed_activities(self, user_id=None):
+    def _evaluate_shard(self, shard_index, shard_count, now):
+        """Evaluate one user shard in its own app context (and so its own DB session)"""
+        from app.services.missedactivities import find_due_incomplete_activities
+
+        started = time_module.perf_counter()
+        with metrics.count_queries() as queries, self.app.app_context():
+            rows = find_due_incomplete_activities(now=now, shard=(shard_index, shard_count))
+        return rows, {
+            'shard': shard_index,
+            'rows': len(rows),
+            'queries': queries[0],
+            'seconds': round(time_module.perf_counter() - started, 4)
+        }
+
+    def sweep_missed_activities(self, shards=None, workers=None, now=None):
+        """Evaluate all users split into user_id % shards partitions on a thread pool.
+
+        Returns the merged due-but-incomplete rows and per-shard timings; the
+        rows are dispatched afterwards in a single session.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        shards = shards or self.sweep_shards
+        workers = min(workers or self.sweep_workers, shards)
+        now = now or datetime.now()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sweep') as pool:
+            results = list(pool.map(lambda index: self._evaluate_shard(index, shards, now), range(shards)))
+
+        rows = [row for shard_rows, _ in results for row in shard_rows]
+        timings = [timing for _, timing in results]
+        return rows, timings
+
+    def check_and_notify_missed_activities(self, user_id=None, shards=None):
         """Check for missed activities for all users or specific user"""
         try:
-            with self.app.app_context():
-                from app.models import User
+            started = time_module.perf_counter()
+            shards = shards or self.sweep_shards
 
-                if user_id:
-                    users = User.query.filter_by(id=user_id).all()
-                else:
-                    users = User.query.all()
+            with metrics.count_queries() as queries:
+                if user_id or shards <= 1:
+                    with self.app.app_context():
+                        from app.services.missedactivities import find_due_incomplete_activities
 
-                total_notifications = 0
-                for user in users:
-                    print(f"🔍 Checking missed activities for user: {user.name}")
-                    notifications = self.check_missed_activities_for_user(user.id)
-                    total_notifications += notifications
-
-                print(f"📊 Total notifications sent: {total_notifications}")
-                return total_notifications
+                        # One set-based query for every user instead of one loop per user
+                        rows = find_due_incomplete_activities(user_ids=[int(user_id)] if user_id else None)
+                    timings = []
+                else:
+                    rows, timings = self.sweep_missed_activities(shards=shards)
+                    for timing in timings:
+                        print(f"🧩 Shard {timing['shard']}/{shards}: {timing['rows']} rows in {timing['seconds']}s")
+                    # Shard threads count their own statements
+                    queries[0] += sum(timing['queries'] for timing in timings)
+
+                print(f"🔍 Found {len(rows)} due activities still incomplete")
+                metrics.activities_evaluated.inc(len(rows), kind='sweep')
+
+                with self.app.app_context():
+                    total_notifications = self.apply_missed_activity_decisions(rows)
+
+            elapsed = time_module.perf_counter() - started
+            metrics.sweep_duration.observe(elapsed, kind='sweep')
+            metrics.sweep_queries.observe(queries[0], kind='sweep')
+
+            self.last_sweep = {
+                'shards': shards if not user_id else 1,
+                'shard_timings': timings,
+                'rows': len(rows),
+                'queries': queries[0],
+                'notifications': total_notifications,
+                'seconds': round(elapsed, 4)
+            }
+            print(f"📊 Total notifications sent: {total_notifications}")
+            return total_notifications
 
         except Exception as e:
             print(f"❌ Error in check_and_notify_missed_activities: {e}")
             return 0
 
+    def run_reconciliation_sweeps(self):
+        """Leader-only loop: periodic full sweep behind the due-time scheduler.
+
+        The outbox idempotency keys make alerts the scheduler already queued
+        no-ops, so the sweep only sends what would otherwise have been missed.
+        """
+        while self.running and self.is_leader:
+            self._sweep_wakeup.wait(self.sweep_interval_seconds)
+            self._sweep_wakeup.clear()
+            if not (self.running and self.is_leader):
+                break
+            self.check_and_notify_missed_activities()
+
+    def start_reconciliation_sweeps(self):
+        if self.sweep_interval_seconds <= 0:
+            return
+        if self._sweep_thread and self._sweep_thread.is_alive():
+            return
+        self._sweep_thread = threading.Thread(target=self.run_reconciliation_sweeps, daemon=True)
+        self._sweep_thread.start()
+
+    def stop_reconciliation_sweeps(self):
+        self._sweep_wakeup.set()
+
     def check_missed_activities(self):
-        """Background thread to check for missed activities"""
+        """Background thread: run the alert scheduler, outbox and sweeps only while this process holds the monitor lease"""
         while self.running:
             try:
-                print("🕒 Background check for missed activities...")
-                # Check for all users in background
-                self.check_and_notify_missed_activities()
+                leader = self.monitor_lease.try_acquire()
             except Exception as e:
-                print(f"❌ Error in missed activities check: {e}")
-
-            # Check every 5 minutes
-            time_module.sleep(300)  # FIXED: Use time_module
+                print(f"❌ Error renewing monitor lease: {e}")
+                leader = False
+
+            if leader and not self.is_leader:
+                print(f"👑 This process now leads the notification monitor ({self.monitor_lease.holder})")
+                self.is_leader = True
+                self.scheduler.start()
+                self.outbox.start()
+                self.rollup.start()
+                self.start_reconciliation_sweeps()
+            elif not leader and self.is_leader:
+                print("⚠️ Lost the notification monitor lease, stopping background checks")
+                self.is_leader = False
+                self.scheduler.stop()
+                self.outbox.stop()
+                self.rollup.stop()
+                self.stop_reconciliation_sweeps()
+
+            self._monitor_wakeup.wait(self.monitor_lease.heartbeat_seconds)
+
+        if self.is_leader:
+            self.is_leader = False
+            self.scheduler.stop()
+            self.outbox.stop()
+            self.rollup.stop()
+            self.stop_reconciliation_sweeps()
+            self.monitor_lease.release()
 
     def check_missed_activities_on_login(self, user_id):
-        """Check for missed activities when user logs in - FORCE NOTIFICATION"""
+        """Check for missed activities when user logs in - FORCE NOTIFICATION.
+
+        Runs as a background job, so errors are re-raised for the job to be
+        reported as failed.
+        """
         try:
             print(f"🔔 Checking missed activities for user {user_id} on login")
-            notifications_sent = self.check_missed_activities_for_user(user_id, force_notify=True)
+            notifications_sent = self.evaluate_user_missed_activities(user_id, force_notify=True)
             print(f"✅ Sent {notifications_sent} notifications on login")
             return notifications_sent
         except Exception as e:
             print(f"❌ Error checking missed activities on login: {e}")
-            return 0
+            raise
+
+    def schedule_login_check(self, user_id):
+        """Queue the login-time missed activity check; returns a job id the client can poll"""
+        return self.jobs.submit('login_missed_activity_check', self.check_missed_activities_on_login,
+                                user_id, owner_id=user_id)
 
     def start_monitoring(self):
         """Start the notification monitoring service"""
         self.running = True
-        monitor_thread = threading.Thread(target=self.check_missed_activities, daemon=True)
-        monitor_thread.start()
+        self._monitor_wakeup.clear()
+        self._monitor_thread = threading.Thread(target=self.check_missed_activities, daemon=True)
+        self._monitor_thread.start()
         print("🔔 Notification monitoring started")
 
-    def stop_monitoring(self):
-        """Stop the notification monitoring service"""
-        self.running = False
\ No newline at end of file
+    def stop_monitoring(self, timeout=10):
+        """Stop the notification monitoring service; waits for the monitor to hand back its lease"""
+        self.running = False
+        self._monitor_wakeup.set()
+        if self._monitor_thread:
+            self._monitor_thread.join(timeout)
+            self._monitor_thread = None
+        self.jobs.shutdown()
+        self.mail_queue.stop()
\ No newline at end of file
@@ -0,0 +1,71 @@
+# pagination.py - cursor based (keyset) pagination for list endpoints
+#
+# Pages are addressed by the (timestamp, id) of the last row already returned
+# instead of an OFFSET, so every page is an index range scan of `limit` rows
+# no matter how deep the client has paged. The cursor is opaque to clients.
+import base64
+import json
+from datetime import datetime
+
+from app import db
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(timestamp, row_id):
+    payload = json.dumps([timestamp.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Cursor -> (timestamp, id); raises ValueError for anything that is not one of ours"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_size(limit, default, maximum=MAX_PAGE_SIZE):
+    """Requested page size clamped to 1..maximum; raises ValueError if it is not a number"""
+    if limit in (None, ''):
+        return default
+    try:
+        return max(1, min(int(limit), maximum))
+    except (TypeError, ValueError):
+        raise ValueError('limit must be a number')
+
+
+def keyset_page(query, timestamp_column, id_column, cursor=None, limit=None, default_limit=20,
+                descending=True):
+    """Return (rows, next_cursor) for one page of query ordered by (timestamp_column, id_column).
+
+    next_cursor is None on the last page. The query should filter on the
+    leading columns of an index ending in (timestamp, id), e.g. (user_id,
+    created_at, id), so the page is read straight from the index. The
+    timestamp column must not hold NULLs (all of ours default to utcnow).
+    """
+    size = page_size(limit, default_limit)
+    rows = keyset_query(query, timestamp_column, id_column, cursor, size, descending).all()
+    if len(rows) <= size:
+        return rows, None
+
+    rows = rows[:size]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
+
+
+def keyset_query(query, timestamp_column, id_column, cursor, size, descending=True):
+    """The query keyset_page runs: one page plus one row, to tell whether another page follows"""
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        position = db.tuple_(timestamp_column, id_column)
+        query = query.filter(position < (timestamp, row_id) if descending else position > (timestamp, row_id))
+
+    if descending:
+        query = query.order_by(timestamp_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(timestamp_column.asc(), id_column.asc())
+
+    return query.limit(size + 1)
@@ -0,0 +1,144 @@
+# queryplans.py - query-plan regression check for the endpoint queries
+#
+# Each entry below builds its statement with the same query builder the
+# endpoint or background job uses, so the SQL that is explained is the SQL
+# the ORM actually emits. check_query_plans() asks the database for its plan
+# and fails a query when the table is read with a full scan instead of an
+# index search, or when a paged list needs a sort step instead of reading
+# rows in index order. tests/test_queryplans.py runs it on SQLite; run
+# `flask --app run check-query-plans` against PostgreSQL after schema changes.
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import db
+
+_NOW = datetime(2024, 1, 1, 12, 0)
+_TODAY = date(2024, 1, 1)
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN [QUERY PLAN] <statement>, with the statement's own bound parameters"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN QUERY PLAN' if compiler.dialect.name == 'sqlite' else 'EXPLAIN'
+    return f"{prefix} {compiler.process(element.statement, **kw)}"
+
+
+def _family_list():
+    from app.models import FamilyMember
+    return FamilyMember.query.filter_by(user_id=1)
+
+
+def _complete_by_activity_name():
+    from app.routes.activities import _active_activity_id
+    return _active_activity_id(1, 'Morning Medication')
+
+
+def _completed_today():
+    from app.services.missedactivities import completed_activity_ids_query
+    return completed_activity_ids_query([1, 2, 3], _TODAY)
+
+
+def _today_schedule():
+    from app.services.schedulecache import today_schedule_query
+    return today_schedule_query(1, _TODAY)
+
+
+def _game_stats_by_type():
+    # Query.count() wraps the filtered query in SELECT count(*) FROM (...)
+    from app.models import GameSession
+    query = GameSession.query.filter_by(user_id=1, game_type='tic_tac_toe', score=1)
+    return db.select(db.func.count()).select_from(query.subquery())
+
+
+def _adherence_history():
+    from app.services.adherencerollup import history_per_day_query
+    return history_per_day_query(1, _TODAY, _TODAY)
+
+
+def _missed_activity_sweep():
+    from app.services.missedactivities import due_incomplete_activities_query
+    return due_incomplete_activities_query(_NOW)
+
+
+def _outbox_due_rows():
+    from app.services.notificationoutbox import due_outbox_query
+    return due_outbox_query(_NOW, 50)
+
+
+def _paged(model_name, timestamp_column, size, descending=True, cursor=True):
+    """keyset_page over the user's rows, as the list endpoints call it"""
+    def build():
+        from app import models
+        from app.pagination import encode_cursor, keyset_query
+
+        model = getattr(models, model_name)
+        return keyset_query(
+            model.query.filter_by(user_id=1), getattr(model, timestamp_column), model.id,
+            encode_cursor(_NOW, 1) if cursor else None, size, descending
+        )
+    return build
+
+
+# (name, table that must be searched, statement builder, must come back in index order)
+QUERIES = [
+    ('family list', 'family_member', _family_list, False),
+    ('complete by activity name', 'user_activity', _complete_by_activity_name, False),
+    ('completed today', 'activity_completion', _completed_today, False),
+    ('today schedule', 'user_activity', _today_schedule, False),
+    ('user activities page', 'user_activity', _paged('UserActivity', 'created_at', 100, descending=False), True),
+    ('missed activities page', 'missed_activity', _paged('MissedActivity', 'created_at', 10), True),
+    ('photos page', 'memory_photo', _paged('MemoryPhoto', 'uploaded_at', 50), True),
+    ('scores page', 'game_session', _paged('GameSession', 'created_at', 10, cursor=False), True),
+    ('game stats by type', 'game_session', _game_stats_by_type, False),
+    ('adherence history', 'daily_adherence', _adherence_history, True),
+    ('missed-activity sweep', 'user_activity', _missed_activity_sweep, False),
+    ('outbox due rows', 'notification_outbox', _outbox_due_rows, True),
+]
+
+
+def _sqlite_problems(table, plan, ordered):
+    details = [row[-1] for row in plan]
+    problems = [detail for detail in details
+                if detail.startswith(f'SCAN {table}') or detail.startswith(f'SCAN TABLE {table}')]
+    if ordered:
+        problems += [detail for detail in details if 'TEMP B-TREE' in detail]
+    return details, problems
+
+
+def _postgresql_problems(table, plan, ordered):
+    details = [row[0] for row in plan]
+    problems = [detail for detail in details if f'Seq Scan on {table}' in detail]
+    if ordered:
+        problems += [detail for detail in details if detail.strip().startswith('->  Sort') or
+                     detail.strip().startswith('Sort ')]
+    return details, problems
+
+
+def check_query_plans():
+    """Return [(name, ok, plan lines, problems)] for every query"""
+    dialect = db.engine.dialect.name
+    results = []
+    for name, table, build, ordered in QUERIES:
+        statement = build()
+        # ORM Query objects expose their Core statement
+        statement = getattr(statement, 'statement', statement)
+        if dialect == 'postgresql':
+            db.session.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = db.session.execute(Explain(statement)).all()
+        if dialect == 'postgresql':
+            details, problems = _postgresql_problems(table, plan, ordered)
+        else:
+            details, problems = _sqlite_problems(table, plan, ordered)
+        results.append((name, not problems, details, problems))
+    db.session.rollback()
+    return results
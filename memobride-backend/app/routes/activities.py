@@ -1,9 +1,10 @@
 # activities.py - FIXED JWT ISSUES
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
 from app.models import UserActivity, ActivityCompletion, User
 from app import db
-from datetime import datetime, date
+from app.conditional import bump_data_version, etag_by_user_version
+from datetime import datetime, date, timedelta, timezone
 import logging
 
 # Add url_prefix here
@@ -14,6 +15,73 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+# Map frontend times to backend format
+TIME_MAPPING = {
+    "9:00 AM": "09:00",
+    "11:00 AM": "11:00",
+    "2:00 PM": "14:00",
+    "4:00 PM": "16:00",
+    "6:00 PM": "18:00",
+    "8:00 PM": "20:00"
+}
+
+
+def _insert_completion(activity_source, completed_on, completed_at=None):
+    """INSERT ... SELECT a completion for the activity picked by activity_source, ignoring duplicates.
+
+    activity_source is a SELECT returning one UserActivity id. The unique
+    (activity_id, completed_on) index turns a repeat into a no-op, so the
+    whole completion is one statement. Returns (completion_id, activity_id),
+    or None when nothing was inserted.
+    """
+    from app.dbhelpers import insert_ignoring_conflicts
+
+    completed_at = completed_at or datetime.utcnow()
+    source = activity_source.add_columns(
+        db.literal(completed_at, db.DateTime),
+        db.literal(completed_on, db.Date),
+        db.literal(True)
+    )
+    statement = insert_ignoring_conflicts(
+        ActivityCompletion, ['activity_id', 'completed_on']
+    ).from_select(
+        ['activity_id', 'completed_at', 'completed_on', 'completed_by_user'], source
+    ).returning(ActivityCompletion.id, ActivityCompletion.activity_id)
+    return db.session.execute(statement).first()
+
+
+def _active_activity_id(user_id, activity_name):
+    """SELECT the id of the user's active activity with this name"""
+    return db.select(UserActivity.id).where(
+        UserActivity.user_id == user_id,
+        UserActivity.activity_name == activity_name,
+        UserActivity.is_active == True
+    ).order_by(UserActivity.id).limit(1)
+
+
+def _completions_committed(user_id, created_activities, completions):
+    """Write committed changes through to the alert scheduler and the today cache.
+
+    completions maps (activity_id, completed_on) to the new completion id.
+    """
+    today = date.today()
+    notification_service = getattr(current_app, 'notification_service', None)
+    schedule_cache = getattr(current_app, 'schedule_cache', None)
+
+    for activity in created_activities:
+        if notification_service:
+            notification_service.activity_changed(activity)
+
+    completed_today = [activity_id for activity_id, completed_on in completions if completed_on == today]
+    for activity_id in completed_today:
+        if notification_service:
+            notification_service.completion_recorded(activity_id, today)
+
+    # One rebuild covers every change in the batch
+    if schedule_cache and (created_activities or completed_today):
+        schedule_cache.refresh(user_id)
+
+
 @bp.route('/complete', methods=['POST'])
 @jwt_required()
 def mark_activity_completed():
@@ -35,69 +103,58 @@ def mark_activity_completed():
         if not activity_name:
             return jsonify({'error': 'Activity name is required'}), 400
 
-        # Check if user exists
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
-        # Find or create activity
-        user_activity = UserActivity.query.filter_by(
-            user_id=user_id,
-            activity_name=activity_name,
-            is_active=True
-        ).first()
+        # Common case: the activity exists and is not done yet - one statement
+        today = date.today()
+        inserted = _insert_completion(_active_activity_id(user_id, activity_name), today)
 
-        # If activity doesn't exist, create it
-        if not user_activity:
-            logger.info(f"📝 Creating new activity: {activity_name} for user {user_id}")
+        created = False
+        user_activity = None
+        if inserted is None:
+            # Either it is already completed today or the activity does not exist yet
+            user_activity = UserActivity.query.filter_by(
+                user_id=user_id,
+                activity_name=activity_name,
+                is_active=True
+            ).order_by(UserActivity.id).first()
 
-            # Map frontend times to backend format
-            time_mapping = {
-                "9:00 AM": "09:00",
-                "11:00 AM": "11:00",
-                "2:00 PM": "14:00",
-                "4:00 PM": "16:00",
-                "6:00 PM": "18:00",
-                "8:00 PM": "20:00"
-            }
+            if user_activity:
+                logger.info(f"ℹ️ Activity already completed today: {activity_name}")
+                return jsonify({'message': 'Activity already completed today'}), 200
 
-            scheduled_time = time_mapping.get(data.get('time', ''), "09:00")
+            # Check if user exists
+            user = User.query.get(user_id)
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
 
+            logger.info(f"📝 Creating new activity: {activity_name} for user {user_id}")
             user_activity = UserActivity(
                 user_id=user_id,
                 activity_name=activity_name,
-                scheduled_time=scheduled_time,
+                scheduled_time=TIME_MAPPING.get(data.get('time', ''), "09:00"),
                 days_of_week='1,2,3,4,5,6,7',  # Every day
                 is_active=True
             )
             db.session.add(user_activity)
             db.session.flush()  # Get the ID without committing
+            created = True
             logger.info(f"✅ Created activity: {user_activity.id}")
 
-        # Check if already completed today
-        today = date.today()
-        existing_completion = ActivityCompletion.query.filter(
-            ActivityCompletion.activity_id == user_activity.id,
-            db.func.date(ActivityCompletion.completed_at) == today
-        ).first()
-
-        if existing_completion:
-            logger.info(f"ℹ️ Activity already completed today: {activity_name}")
-            return jsonify({'message': 'Activity already completed today'}), 200
-
-        # Create completion record
-        completion = ActivityCompletion(
-            activity_id=user_activity.id,
-            completed_by_user=True
-        )
-        db.session.add(completion)
+            inserted = _insert_completion(db.select(db.literal(user_activity.id)), today)
+            if inserted is None:
+                db.session.rollback()
+                return jsonify({'message': 'Activity already completed today'}), 200
+
+        completion_id, activity_id = inserted
+        bump_data_version(user_id)
         db.session.commit()
 
-        logger.info(f"✅ Activity completed: {activity_name} (Completion ID: {completion.id})")
+        _completions_committed(user_id, [user_activity] if created else [], {(activity_id, today): completion_id})
+
+        logger.info(f"✅ Activity completed: {activity_name} (Completion ID: {completion_id})")
 
         return jsonify({
             'message': 'Activity marked as completed',
-            'completion_id': completion.id,
+            'completion_id': completion_id,
             'activity_name': activity_name,
             'user_id': user_id
         }), 200
@@ -108,8 +165,229 @@ def mark_activity_completed():
         return jsonify({'error': str(e)}), 500
 
 
+# Largest sync accepted in one request
+MAX_BATCH_COMPLETIONS = 500
+
+
+def _parse_client_timestamp(value):
+    """Client ISO-8601 timestamp -> (completed_at in UTC, local completion day)"""
+    if not value:
+        now = datetime.now()
+        return datetime.utcnow(), now.date()
+
+    moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        # Naive timestamps are taken as server local time, like date.today()
+        moment = moment.astimezone()
+    local = moment.astimezone().replace(tzinfo=None)
+    utc = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return utc, local.date()
+
+
+@bp.route('/complete/batch', methods=['POST'])
+@jwt_required()
+def mark_activities_completed_batch():
+    """Record many completions at once, e.g. a tablet syncing after being offline.
+
+    Body: {"completions": [{"activity_name": ..., "completed_at": ISO-8601, "time": ...}, ...]}
+    Everything is validated up front, names are resolved in one query and the
+    new completions are inserted in one statement and one transaction. The
+    response has one result per item, in request order.
+    """
+    try:
+        verify_jwt_in_request()
+        user_id = get_jwt_identity()
+
+        data = request.get_json()
+        items = data.get('completions') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'completions must be a non-empty list'}), 400
+        if len(items) > MAX_BATCH_COMPLETIONS:
+            return jsonify({'error': f'At most {MAX_BATCH_COMPLETIONS} completions per request'}), 400
+
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+
+        logger.info(f"🎯 Batch of {len(items)} completions for user {user_id}")
+
+        # Validate everything before touching the database
+        results = [None] * len(items)
+        valid = []
+        now = datetime.utcnow()
+        for position, item in enumerate(items):
+            name = item.get('activity_name') if isinstance(item, dict) else None
+            if not name:
+                results[position] = {'status': 'invalid', 'error': 'Activity name is required'}
+                continue
+            try:
+                completed_at, completed_on = _parse_client_timestamp(item.get('completed_at'))
+            except (TypeError, ValueError):
+                results[position] = {'status': 'invalid', 'error': 'completed_at must be an ISO-8601 timestamp'}
+                continue
+            if completed_at > now + timedelta(minutes=5):
+                results[position] = {'status': 'invalid', 'error': 'completed_at is in the future'}
+                continue
+            valid.append((position, name, completed_at, completed_on, item.get('time', '')))
+
+        # Resolve every name in one query, creating any activity the user does not have yet
+        names = {name for _, name, _, _, _ in valid}
+        activity_ids = {}
+        if names:
+            for activity in UserActivity.query.filter(
+                UserActivity.user_id == user_id,
+                UserActivity.is_active == True,
+                UserActivity.activity_name.in_(names)
+            ).order_by(UserActivity.id.desc()).all():
+                activity_ids[activity.activity_name] = activity.id
+
+        missing = {}
+        for _, name, _, _, time_label in valid:
+            if name not in activity_ids and name not in missing:
+                missing[name] = UserActivity(
+                    user_id=user_id,
+                    activity_name=name,
+                    scheduled_time=TIME_MAPPING.get(time_label, "09:00"),
+                    days_of_week='1,2,3,4,5,6,7',  # Every day
+                    is_active=True
+                )
+        created = list(missing.values())
+        if created:
+            db.session.add_all(created)
+            db.session.flush()  # Get the IDs without committing
+            activity_ids.update((activity.activity_name, activity.id) for activity in created)
+
+        # One row per (activity, day); repeats inside the batch are reported as duplicates
+        rows = {}
+        for position, name, completed_at, completed_on, _ in valid:
+            key = (activity_ids[name], completed_on)
+            if key in rows:
+                results[position] = {'status': 'duplicate', 'activity_name': name}
+                continue
+            rows[key] = {
+                'activity_id': key[0],
+                'completed_at': completed_at,
+                'completed_on': completed_on,
+                'completed_by_user': True,
+                'position': position,
+                'name': name
+            }
+
+        inserted = {}
+        if rows:
+            from app.dbhelpers import insert_ignoring_conflicts
+
+            statement = insert_ignoring_conflicts(
+                ActivityCompletion, ['activity_id', 'completed_on']
+            ).values([
+                {column: row[column] for column in ('activity_id', 'completed_at', 'completed_on', 'completed_by_user')}
+                for row in rows.values()
+            ]).returning(ActivityCompletion.id, ActivityCompletion.activity_id, ActivityCompletion.completed_on)
+            inserted = {
+                (row.activity_id, row.completed_on): row.id
+                for row in db.session.execute(statement)
+            }
+        if inserted:
+            bump_data_version(user_id)
+        db.session.commit()
+
+        for key, row in rows.items():
+            completed_on = row['completed_on'].isoformat()
+            if key in inserted:
+                results[row['position']] = {
+                    'status': 'completed',
+                    'activity_name': row['name'],
+                    'completion_id': inserted[key],
+                    'completed_on': completed_on
+                }
+            else:
+                results[row['position']] = {
+                    'status': 'already_completed',
+                    'activity_name': row['name'],
+                    'completed_on': completed_on
+                }
+
+        _completions_committed(user_id, created, inserted)
+
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        logger.info(f"✅ Batch completions for user {user_id}: {summary}")
+
+        return jsonify({
+            'message': 'Batch processed',
+            'user_id': user_id,
+            'summary': summary,
+            'results': results
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"❌ Error in batch completion: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/today', methods=['GET'])
+@jwt_required()
+@etag_by_user_version
+def get_today_schedule():
+    """Today's active activities with completion status, served from the schedule cache"""
+    try:
+        verify_jwt_in_request()
+        user_id = get_jwt_identity()
+
+        schedule = current_app.schedule_cache.get(user_id)
+        return jsonify(schedule), 200
+
+    except Exception as e:
+        logger.error(f"❌ Error getting today's schedule: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+# Longest range the history endpoint will aggregate in one request
+MAX_HISTORY_DAYS = 3 * 366
+
+
+@bp.route('/history', methods=['GET'])
+@jwt_required()
+def get_adherence_history():
+    """Adherence over a date range from the nightly rollup: ?from=YYYY-MM-DD&to=YYYY-MM-DD&granularity=day|week|month"""
+    try:
+        verify_jwt_in_request()
+        user_id = get_jwt_identity()
+
+        from app.services.adherencerollup import GRANULARITIES, adherence_history
+
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+
+        try:
+            # Today is rolled up tonight, so the default range ends yesterday
+            end = date.fromisoformat(request.args['to']) if request.args.get('to') \
+                else date.today() - timedelta(days=1)
+            start = date.fromisoformat(request.args['from']) if request.args.get('from') \
+                else end - timedelta(days=29)
+        except ValueError:
+            return jsonify({'error': 'from and to must be dates in YYYY-MM-DD format'}), 400
+
+        if start > end:
+            return jsonify({'error': 'from must not be after to'}), 400
+        if (end - start).days >= MAX_HISTORY_DAYS:
+            return jsonify({'error': f'Range is limited to {MAX_HISTORY_DAYS} days'}), 400
+
+        history = adherence_history(int(user_id), start, end, granularity)
+        history['user_id'] = user_id
+        return jsonify(history), 200
+
+    except Exception as e:
+        logger.error(f"❌ Error getting adherence history: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 @bp.route('/debug/user-activities', methods=['GET'])
 @jwt_required()
+@etag_by_user_version
 def debug_user_activities():
     """Debug endpoint to check user's activities"""
     try:
@@ -118,24 +396,23 @@ def debug_user_activities():
 
         logger.info(f"🔍 Debug user activities for user {user_id}")
 
-        user_activities = UserActivity.query.filter_by(user_id=user_id).all()
-        today = date.today()
+        # Every activity, inactive ones included, so not from the (active-only) schedule cache
+        rows = db.session.query(UserActivity, ActivityCompletion.id).outerjoin(
+            ActivityCompletion,
+            db.and_(
+                ActivityCompletion.activity_id == UserActivity.id,
+                ActivityCompletion.completed_on == date.today()
+            )
+        ).filter(UserActivity.user_id == user_id).all()
 
-        activities_data = []
-        for activity in user_activities:
-            completion = ActivityCompletion.query.filter(
-                ActivityCompletion.activity_id == activity.id,
-                db.func.date(ActivityCompletion.completed_at) == today
-            ).first()
-
-            activities_data.append({
-                'id': activity.id,
-                'name': activity.activity_name,
-                'scheduled_time': activity.scheduled_time,
-                'is_active': activity.is_active,
-                'completed_today': completion is not None,
-                'completion_id': completion.id if completion else None
-            })
+        activities_data = [{
+            'id': activity.id,
+            'name': activity.activity_name,
+            'scheduled_time': activity.scheduled_time,
+            'is_active': activity.is_active,
+            'completed_today': completion_id is not None,
+            'completion_id': completion_id
+        } for activity, completion_id in rows]
 
         logger.info(f"📊 Found {len(activities_data)} activities for user {user_id}")
 
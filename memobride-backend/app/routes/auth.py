@@ -1,8 +1,8 @@
 # auth.py - COMPLETELY FIXED VERSION
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, create_refresh_token
 from app import db, bcrypt
-from app.models import User
+from app.models import User, UserActivity
 from datetime import timedelta
 import traceback
 
@@ -51,8 +51,19 @@ def register():
         user.set_password(password)  # Use the method
 
         db.session.add(user)
+        db.session.flush()
+
+        # Default routine in the same transaction, one bulk insert
+        from app.services.defaultactivities import provision_default_activities
+        provision_default_activities([user.id])
         db.session.commit()
 
+        # Schedule alerts for the new activities
+        notification_service = getattr(current_app, 'notification_service', None)
+        if notification_service:
+            for activity in UserActivity.query.filter_by(user_id=user.id).all():
+                notification_service.activity_changed(activity)
+
         # Create tokens
         access_token = create_access_token(
             identity=str(user.id),
@@ -117,10 +128,10 @@ def login():
             expires_delta=REFRESH_TOKEN_EXPIRES
         )
 
-        # Check for missed activities on login
+        # Check for missed activities on login in the background
+        notification_job_id = None
         try:
-            from flask import current_app
-            current_app.notification_service.check_missed_activities_on_login(user.id)
+            notification_job_id = current_app.notification_service.schedule_login_check(user.id)
         except Exception as notification_error:
             print(f"⚠️ Notification error on login: {notification_error}")
             # Don't fail login if notifications fail
@@ -131,7 +142,8 @@ def login():
             'message': 'Login successful',
             'access_token': access_token,
             'refresh_token': refresh_token,
-            'user': user.to_dict()
+            'user': user.to_dict(),
+            'notification_job_id': notification_job_id
         }), 200
 
     except Exception as e:
@@ -3,12 +3,14 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import User, FamilyMember
 from app import db
+from app.conditional import etag_by_user_version
 
 # Add url_prefix here
 bp = Blueprint('family', __name__, url_prefix='/api/family')
 
 @bp.route('', methods=['GET'])
 @jwt_required()
+@etag_by_user_version
 def get_family_members():
     try:
         user_id = get_jwt_identity()
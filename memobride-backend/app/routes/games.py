@@ -2,7 +2,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
+from app.conditional import bump_data_version, etag_by_user_version
 from app.models import User, GameSession
+from app.pagination import keyset_page
 import random
 from datetime import datetime
 
@@ -369,12 +371,23 @@ def scores_options():
 
 @bp.route('/scores', methods=['GET'])
 @jwt_required()
+@etag_by_user_version
 def get_game_scores():
     try:
         user_id = get_jwt_identity()
-        scores = GameSession.query.filter_by(user_id=user_id).order_by(GameSession.created_at.desc()).limit(10).all()
+        try:
+            scores, next_cursor = keyset_page(
+                GameSession.query.filter_by(user_id=user_id),
+                GameSession.created_at, GameSession.id,
+                cursor=request.args.get('cursor'),
+                limit=request.args.get('limit'),
+                default_limit=10
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         return jsonify({
+            'next_cursor': next_cursor,
             'scores': [{
                 'id': score.id,
                 'game_type': score.game_type,
@@ -395,6 +408,7 @@ def stats_options():
 
 @bp.route('/stats', methods=['GET'])
 @jwt_required()
+@etag_by_user_version
 def get_game_stats():
     try:
         user_id = get_jwt_identity()
@@ -454,6 +468,8 @@ def reset_game_data():
         else:
             # Delete specific game type
             GameSession.query.filter_by(user_id=user_id, game_type=game_type).delete()
+        # Bulk deletes skip the ORM hook that bumps the version
+        bump_data_version(user_id)
 
         db.session.commit()
 
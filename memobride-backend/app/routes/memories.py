@@ -1,10 +1,10 @@
 import os
-import uuid
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, send_file as werkzeug_send_file
 
 from app import db
+from app.conditional import etag_by_user_version
 from app.models import MemoryPhoto, User
 
 bp = Blueprint('memories', __name__, url_prefix='/api/memories')
@@ -50,37 +50,41 @@ def upload_photo():
         if not file or not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}), 400
 
-        # Generate unique filename
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{user_id}_{uuid.uuid4().hex}.{file_extension}"
-
-        # Use app config for upload folder
-        memories_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'memories')
-        os.makedirs(memories_folder, exist_ok=True)
-
-        file_path = os.path.join(memories_folder, unique_filename)
-
-        print(f"💾 Saving to: {file_path}")
+        # Stored by content hash, so the user's identical uploads share one file
+        from app.services.photostore import memories_folder, store_upload
+        from app.services.photovariants import reuse_duplicate_variants
+        from app.services.photohash import bump_photo_version, hash_for_upload
 
-        # Save the file
-        file.save(file_path)
-
-        # Verify file was saved
-        if not os.path.exists(file_path):
-            return jsonify({'success': False, 'error': 'Failed to save file'}), 500
+        file_extension = file.filename.rsplit('.', 1)[1].lower()
+        blob_id, stored_filename, is_new = store_upload(file, file_extension, int(user_id))
+        print(f"💾 Stored as {stored_filename}" + ('' if is_new else ' (duplicate of an earlier upload)'))
 
         # Create memory photo record
         memory_photo = MemoryPhoto(
             user_id=int(user_id),
             category=category,
-            filename=unique_filename,
+            filename=stored_filename,
+            blob_id=blob_id,
             original_filename=secure_filename(file.filename),
-            description=description
+            description=description,
+            variants_status='pending',
+            dhash=hash_for_upload(blob_id, os.path.join(memories_folder(), stored_filename))
         )
 
         db.session.add(memory_photo)
+        db.session.flush()
+        has_variants = not is_new and reuse_duplicate_variants(memory_photo)
+        if memory_photo.dhash is not None:
+            bump_photo_version(user_id)
         db.session.commit()
 
+        if memory_photo.dhash is not None:
+            current_app.photo_index.added(user_id, memory_photo.id, memory_photo.dhash)
+
+        # Thumbnails are built after the response; the gallery falls back to the original until then
+        if not has_variants:
+            current_app.photo_variants.submit(memory_photo.id)
+
         print("✅ Photo uploaded successfully")
 
         return jsonify({
@@ -99,15 +103,24 @@ def upload_photo():
 
 @bp.route('/photos', methods=['GET'])
 @jwt_required()
+@etag_by_user_version
 def get_all_photos():
-    """Get all memory photos for the user"""
+    """Get the user's memory photos, newest first, one page at a time (?cursor=&limit=)"""
     try:
         user_id = get_jwt_identity()
         print(f"📸 Getting photos for user: {user_id}")
 
-        photos = MemoryPhoto.query.filter_by(
-            user_id=int(user_id)
-        ).order_by(MemoryPhoto.uploaded_at.desc()).all()
+        from app.pagination import keyset_page
+        try:
+            photos, next_cursor = keyset_page(
+                MemoryPhoto.query.filter_by(user_id=int(user_id)),
+                MemoryPhoto.uploaded_at, MemoryPhoto.id,
+                cursor=request.args.get('cursor'),
+                limit=request.args.get('limit'),
+                default_limit=50
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
         photos_data = [photo.to_dict() for photo in photos]
 
@@ -115,7 +128,8 @@ def get_all_photos():
 
         return jsonify({
             'success': True,
-            'photos': photos_data
+            'photos': photos_data,
+            'next_cursor': next_cursor
         }), 200
 
     except Exception as e:
@@ -123,35 +137,179 @@ def get_all_photos():
         return jsonify({'success': False, 'error': 'Failed to fetch photos'}), 500
 
 
+@bp.route('/photos/<int:photo_id>', methods=['DELETE'])
+@jwt_required()
+def delete_photo(photo_id):
+    """Delete one of the user's photos; the stored file is removed with its last reference"""
+    try:
+        from app.services.photostore import delete_photo as delete_stored_photo
+        from app.services.photohash import bump_photo_version
+
+        user_id = get_jwt_identity()
+        photo = MemoryPhoto.query.filter_by(id=photo_id, user_id=int(user_id)).first()
+        if not photo:
+            return jsonify({'success': False, 'error': 'Photo not found'}), 404
+
+        hashed = photo.dhash is not None
+        if hashed:
+            bump_photo_version(user_id)
+        delete_stored_photo(photo)
+        if hashed:
+            current_app.photo_index.removed(user_id, photo_id)
+        return jsonify({'success': True, 'message': 'Photo deleted'}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"💥 Delete photo error: {str(e)}")
+        return jsonify({'success': False, 'error': f'Delete failed: {str(e)}'}), 500
+
+
+def _photos_near(photo_id, radius, limit=None):
+    """(response, status) listing the caller's photos within radius of photo_id's hash"""
+    from app.services.photohash import to_unsigned
+
+    user_id = get_jwt_identity()
+    photo = MemoryPhoto.query.filter_by(id=photo_id, user_id=int(user_id)).first()
+    if not photo:
+        return {'success': False, 'error': 'Photo not found'}, 404
+    if photo.dhash is None:
+        return {'success': False, 'error': 'Photo has not been hashed yet'}, 409
+
+    matches = current_app.photo_index.search(user_id, to_unsigned(photo.dhash), radius, exclude_id=photo.id)
+    if limit is not None:
+        matches = matches[:limit]
+    return {
+        'success': True,
+        'photo_id': photo.id,
+        'max_distance': radius,
+        'photos': [dict(match.to_dict(), distance=distance) for distance, match in matches]
+    }, 200
+
+
+@bp.route('/photos/<int:photo_id>/duplicates', methods=['GET'])
+@jwt_required()
+@etag_by_user_version
+def get_near_duplicates(photo_id):
+    """Other photos of the same picture: re-uploads, burst shots, re-scans of a print"""
+    try:
+        from app.services.photohash import NEAR_DUPLICATE_DISTANCE
+
+        body, status = _photos_near(photo_id, NEAR_DUPLICATE_DISTANCE)
+        return jsonify(body), status
+
+    except Exception as e:
+        print(f"💥 Near duplicates error: {str(e)}")
+        return jsonify({'success': False, 'error': 'Failed to find duplicates'}), 500
+
+
+@bp.route('/photos/<int:photo_id>/similar', methods=['GET'])
+@jwt_required()
+@etag_by_user_version
+def get_similar_photos(photo_id):
+    """Photos that look alike, nearest first (?max_distance=&limit=)"""
+    try:
+        from app.services.photohash import SIMILAR_DISTANCE, MAX_SIMILAR_DISTANCE
+
+        try:
+            radius = int(request.args.get('max_distance', SIMILAR_DISTANCE))
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'max_distance and limit must be whole numbers'}), 400
+        if not 0 <= radius <= MAX_SIMILAR_DISTANCE:
+            return jsonify({'success': False,
+                            'error': f'max_distance must be between 0 and {MAX_SIMILAR_DISTANCE}'}), 400
+        if not 1 <= limit <= 100:
+            return jsonify({'success': False, 'error': 'limit must be between 1 and 100'}), 400
+
+        body, status = _photos_near(photo_id, radius, limit)
+        return jsonify(body), status
+
+    except Exception as e:
+        print(f"💥 Similar photos error: {str(e)}")
+        return jsonify({'success': False, 'error': 'Failed to find similar photos'}), 500
+
+
+# Photo filenames are never reused, so browsers and proxies may keep them for a year
+PHOTO_MAX_AGE = 365 * 24 * 3600
+
+PHOTO_MIMETYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif',
+                   'webp': 'image/webp'}
+
+
+def _send_photo(path, size, last_modified):
+    """Send an immutable image file with a strong ETag, 304s and byte ranges.
+
+    With PHOTO_SENDFILE set, the reverse proxy sends the bytes instead:
+    'x-accel' answers with an nginx X-Accel-Redirect to PHOTO_X_ACCEL_PREFIX
+    plus the path under UPLOAD_FOLDER, 'x-sendfile' with an X-Sendfile header
+    holding the absolute path.
+    """
+    name = os.path.basename(path)
+    ext = name.rsplit('.', 1)[1].lower() if '.' in name else ''
+    mimetype = PHOTO_MIMETYPES.get(ext)
+    # Name and length identify the content: originals are never overwritten and
+    # resized copies are regenerated byte for byte, even though the cache touches their mtime
+    etag = f"{name}-{size:x}"
+    mode = current_app.config.get('PHOTO_SENDFILE')
+
+    relative_path = os.path.relpath(path, current_app.config['UPLOAD_FOLDER'])
+    if mode == 'x-sendfile' or (mode == 'x-accel' and not relative_path.startswith('..')):
+        response = current_app.response_class(mimetype=mimetype)
+        if mode == 'x-sendfile':
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        else:
+            response.headers['X-Accel-Redirect'] = current_app.config['PHOTO_X_ACCEL_PREFIX'].rstrip('/') + \
+                '/' + relative_path.replace(os.sep, '/')
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = PHOTO_MAX_AGE
+        response.cache_control.immutable = True
+        # Only answer 304 here; the proxy sends the body and any ranges from disk
+        return response.make_conditional(request)
+
+    response = werkzeug_send_file(
+        path, request.environ, mimetype=mimetype, etag=etag, last_modified=last_modified,
+        max_age=PHOTO_MAX_AGE, response_class=current_app.response_class
+    )
+    response.accept_ranges = 'bytes'
+    response.cache_control.immutable = True
+    return response
+
+
 # FIXED: Remove JWT requirement for image serving so images can be displayed in img tags
 @bp.route('/photos/<filename>', methods=['GET'])
 def serve_photo(filename):
-    """Serve uploaded photos - NO JWT REQUIRED so images work in browser"""
+    """Serve uploaded photos - NO JWT REQUIRED so images work in browser
+
+    ?w=&h=&fmt= serves a resized copy (webp by default) from the resize cache.
+    Responses are cacheable for a year and honour If-None-Match,
+    If-Modified-Since and Range.
+    """
     try:
+        from app.services.resizecache import parse_resize_args
+
+        try:
+            resize = parse_resize_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         memories_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'memories')
         file_path = os.path.join(memories_folder, filename)
 
-        print(f"🖼️ Serving photo: {file_path}")
-        print(f"📁 File exists: {os.path.exists(file_path)}")
-
-        if not os.path.exists(file_path):
-            print(f"❌ File not found: {file_path}")
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
             return jsonify({'error': 'Photo not found'}), 404
 
-        # Determine MIME type based on file extension
-        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        mimetype = None
-        if ext in ['jpg', 'jpeg']:
-            mimetype = 'image/jpeg'
-        elif ext == 'png':
-            mimetype = 'image/png'
-        elif ext == 'gif':
-            mimetype = 'image/gif'
-        elif ext == 'webp':
-            mimetype = 'image/webp'
+        if resize:
+            width, height, fmt = resize
+            resized_path = current_app.resize_cache.get(file_path, width, height, fmt)
+            # Derived from the original, so it changes exactly when the original does
+            return _send_photo(resized_path, os.path.getsize(resized_path), stat.st_mtime)
 
-        return send_file(file_path, mimetype=mimetype)
+        return _send_photo(file_path, stat.st_size, stat.st_mtime)
 
     except Exception as e:
         print(f"💥 Serve photo error: {str(e)}")
-        return jsonify({'error': f'Failed to serve photo: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Failed to serve photo: {str(e)}'}), 500
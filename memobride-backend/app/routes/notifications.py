@@ -3,19 +3,33 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import MissedActivity, User, UserActivity
 from app import db
+from app.conditional import etag_by_user_version
+from app.pagination import keyset_page
 
 bp = Blueprint('notifications', __name__, url_prefix='/api/notifications')
 
 
 @bp.route('/missed-activities', methods=['GET'])
 @jwt_required()
+@etag_by_user_version
 def get_missed_activities():
+    """Missed activities, newest first, one page at a time (?cursor=&limit=)"""
     try:
         user_id = get_jwt_identity()
-        missed_activities = MissedActivity.query.filter_by(user_id=user_id).order_by(
-            MissedActivity.created_at.desc()).limit(10).all()
+        try:
+            missed_activities, next_cursor = keyset_page(
+                MissedActivity.query.filter_by(user_id=user_id),
+                MissedActivity.created_at, MissedActivity.id,
+                cursor=request.args.get('cursor'),
+                limit=request.args.get('limit'),
+                default_limit=10
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         return jsonify({
-            'missed_activities': [activity.to_dict() for activity in missed_activities]
+            'missed_activities': [activity.to_dict() for activity in missed_activities],
+            'next_cursor': next_cursor
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -62,7 +76,7 @@ def test_user_email():
 
         if success:
             return jsonify({
-                'message': f'Test email sent successfully to {user.email}',
+                'message': f'Test email queued for delivery to {user.email}',
                 'user_email': user.email
             }), 200
         else:
@@ -76,14 +90,42 @@ def test_user_email():
 
 @bp.route('/user-activities', methods=['GET'])
 @jwt_required()
+@etag_by_user_version
 def get_user_activities():
-    """Get all activities for the current user"""
+    """Activities of the current user, oldest first, one page at a time (?cursor=&limit=)"""
     try:
         user_id = get_jwt_identity()
-        activities = UserActivity.query.filter_by(user_id=user_id).all()
+        try:
+            activities, next_cursor = keyset_page(
+                UserActivity.query.filter_by(user_id=user_id),
+                UserActivity.created_at, UserActivity.id,
+                cursor=request.args.get('cursor'),
+                limit=request.args.get('limit'),
+                default_limit=100,
+                descending=False
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         return jsonify({
-            'activities': [activity.to_dict() for activity in activities]
+            'activities': [activity.to_dict() for activity in activities],
+            'next_cursor': next_cursor
         }), 200
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_notification_job(job_id):
+    """Poll the status of a background notification job (e.g. the login check)"""
+    try:
+        user_id = get_jwt_identity()
+        job = current_app.notification_service.jobs.get(job_id)
+
+        if not job or job['owner_id'] != str(user_id):
+            return jsonify({'error': 'Job not found'}), 404
+
+        return jsonify({'job': job}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
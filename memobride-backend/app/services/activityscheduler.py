@@ -0,0 +1,285 @@
+# app/services/activityscheduler.py
+import heapq
+import itertools
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, time as dt_time
+
+# Offsets from an activity's scheduled time, matching the notification windows
+USER_ALERT_DELAY = timedelta(minutes=1)
+USER_ALERT_WINDOW_END = timedelta(minutes=20)
+FAMILY_ALERT_DELAY = timedelta(minutes=30)
+FAMILY_ALERT_WINDOW_END = timedelta(minutes=40)
+
+USER_ALERT = 'user_alert'
+FAMILY_ALERT = 'family_alert'
+
+# One pending alert for one occurrence of an activity
+DueEvent = namedtuple('DueEvent', ['kind', 'activity_id', 'user_id', 'occurs_on', 'scheduled_at'])
+
+
+def parse_scheduled_time(value):
+    """Parse "HH:MM" into a time object, or None if the format is invalid"""
+    try:
+        hour, minute = map(int, value.split(':'))
+        return dt_time(hour, minute)
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_days_of_week(value):
+    """Parse "1,2,3" into a set of ISO weekdays (1=Monday, 7=Sunday)"""
+    try:
+        return {int(day.strip()) for day in (value or '').split(',') if day.strip()}
+    except ValueError:
+        return set()
+
+
+# Weekday schedules as a 7-bit mask: bit (d - 1) is set when ISO weekday d is scheduled
+ALL_DAYS_MASK = 0b1111111
+
+
+def weekday_bit(weekday):
+    return 1 << (weekday - 1)
+
+
+def days_to_mask(value):
+    """Comma separated weekdays ("1,2,3") to a weekday mask; unknown days are ignored"""
+    mask = 0
+    for day in parse_days_of_week(value):
+        if 1 <= day <= 7:
+            mask |= weekday_bit(day)
+    return mask
+
+
+def mask_to_days(mask):
+    """Weekday mask back to the comma separated form used by the API"""
+    return ','.join(str(day) for day in range(1, 8) if mask & weekday_bit(day))
+
+
+class ActivityScheduler:
+    """Priority queue of upcoming alert instants for every active activity.
+
+    Instead of re-scanning every user on a fixed interval, the scheduler keeps
+    a heap ordered by the next user-alert and family-alert instant of each
+    activity and sleeps until the earliest one is due. Activity and completion
+    changes update the heap incrementally; stale heap entries are skipped
+    lazily using a per-activity generation number.
+    """
+
+    def __init__(self, notification_service):
+        self.notification_service = notification_service
+        self.app = notification_service.app
+        self.running = False
+
+        # Full rebuild interval, picks up changes made by other processes
+        self.resync_seconds = int(os.environ.get('NOTIFICATION_SCHEDULER_RESYNC_SECONDS', 3600))
+
+        self._heap = []
+        self._counter = itertools.count()
+        self._entries = {}  # activity_id -> schedule entry
+        self._condition = threading.Condition()
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # Schedule maintenance
+    # ------------------------------------------------------------------
+
+    def rebuild(self, now=None):
+        """Load every active activity and rebuild the heap from scratch"""
+        from app.models import UserActivity
+
+        now = now or datetime.now()
+        with self.app.app_context():
+            rows = UserActivity.query.with_entities(
+                UserActivity.id,
+                UserActivity.user_id,
+                UserActivity.scheduled_time,
+                UserActivity.days_mask
+            ).filter_by(is_active=True).all()
+
+        with self._condition:
+            self._heap = []
+            self._entries = {}
+            for row in rows:
+                self._add_entry(row.id, row.user_id, row.scheduled_time, row.days_mask, now)
+            self._condition.notify()
+
+        print(f"🗓️ Scheduler loaded {len(rows)} activities, {len(self._heap)} pending alerts")
+        return len(rows)
+
+    def activity_changed(self, activity, now=None):
+        """Insert, reschedule or drop an activity after it was created or edited.
+
+        Ignored unless this process runs the scheduler: start() loads every
+        activity afresh, and a heap nobody pops would only grow.
+        """
+        now = now or datetime.now()
+        with self._condition:
+            if not self.running:
+                return
+            self._entries.pop(activity.id, None)
+            if activity.is_active:
+                self._add_entry(activity.id, activity.user_id, activity.scheduled_time,
+                                activity.days_mask, now)
+            self._condition.notify()
+
+    def activity_removed(self, activity_id):
+        """Forget an activity; its queued alerts become stale"""
+        with self._condition:
+            self._entries.pop(activity_id, None)
+
+    def completion_recorded(self, activity_id, completed_on):
+        """Suppress the pending alerts of an activity that has been completed"""
+        with self._condition:
+            entry = self._entries.get(activity_id)
+            if entry:
+                entry['completed_on'] = completed_on
+
+    def next_due_at(self):
+        """Instant of the earliest live alert, or None if nothing is queued"""
+        with self._condition:
+            self._drop_stale_head()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due_events(self, now=None):
+        """Remove and return every live event due at or before now"""
+        now = now or datetime.now()
+        due = []
+        with self._condition:
+            while self._heap:
+                self._drop_stale_head()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, _, generation, event = heapq.heappop(self._heap)
+                entry = self._entries[event.activity_id]
+                if entry.get('completed_on') == event.occurs_on:
+                    # Completed since being queued, nothing to alert about
+                    if event.kind == FAMILY_ALERT:
+                        self._schedule_next_occurrence(event.activity_id, entry, now)
+                    continue
+                due.append(event)
+        return due
+
+    def reschedule_after(self, events, now=None):
+        """Queue the next occurrence of activities whose last alert has fired"""
+        now = now or datetime.now()
+        with self._condition:
+            for event in events:
+                if event.kind != FAMILY_ALERT:
+                    continue
+                entry = self._entries.get(event.activity_id)
+                if entry:
+                    self._schedule_next_occurrence(event.activity_id, entry, now)
+
+    def _add_entry(self, activity_id, user_id, scheduled_time, days_mask, now):
+        scheduled = parse_scheduled_time(scheduled_time)
+        if scheduled is None:
+            print(f"❌ Invalid time format for activity {activity_id}: {scheduled_time}")
+            return
+
+        entry = {
+            'user_id': user_id,
+            'scheduled': scheduled,
+            'days_mask': days_mask or 0,
+            'generation': next(self._counter),
+            'completed_on': None
+        }
+        self._entries[activity_id] = entry
+        self._schedule_occurrence(activity_id, entry, now, first_day=now.date())
+
+    def _schedule_next_occurrence(self, activity_id, entry, now):
+        entry['generation'] = next(self._counter)
+        self._schedule_occurrence(activity_id, entry, now, first_day=now.date() + timedelta(days=1))
+
+    def _schedule_occurrence(self, activity_id, entry, now, first_day):
+        """Push the alerts of the first occurrence on or after first_day whose windows are still open"""
+        if not entry['days_mask']:
+            return
+
+        for offset in range(8):
+            day = first_day + timedelta(days=offset)
+            if not entry['days_mask'] & weekday_bit(day.isoweekday()):
+                continue
+
+            scheduled_at = datetime.combine(day, entry['scheduled'])
+            pushed = False
+            if now <= scheduled_at + USER_ALERT_WINDOW_END:
+                self._push(max(scheduled_at + USER_ALERT_DELAY, now), entry, DueEvent(
+                    USER_ALERT, activity_id, entry['user_id'], day, scheduled_at))
+                pushed = True
+            if now <= scheduled_at + FAMILY_ALERT_WINDOW_END:
+                self._push(max(scheduled_at + FAMILY_ALERT_DELAY, now), entry, DueEvent(
+                    FAMILY_ALERT, activity_id, entry['user_id'], day, scheduled_at))
+                pushed = True
+            if pushed:
+                return
+
+    def _push(self, when, entry, event):
+        heapq.heappush(self._heap, (when, next(self._counter), entry['generation'], event))
+
+    def _drop_stale_head(self):
+        while self._heap:
+            _, _, generation, event = self._heap[0]
+            entry = self._entries.get(event.activity_id)
+            if entry is not None and entry['generation'] == generation:
+                return
+            heapq.heappop(self._heap)
+
+    # ------------------------------------------------------------------
+    # Background loop
+    # ------------------------------------------------------------------
+
+    def run(self):
+        """Sleep until the next alert is due, then hand the due batch to the service"""
+        self.rebuild()
+        last_resync = datetime.now()
+
+        while self.running:
+            now = datetime.now()
+            if (now - last_resync).total_seconds() >= self.resync_seconds:
+                self.rebuild(now)
+                last_resync = now
+
+            events = self.pop_due_events(now)
+            if events:
+                try:
+                    self.notification_service.process_due_activity_events(events)
+                except Exception as e:
+                    print(f"❌ Error processing due activity events: {e}")
+                self.reschedule_after(events, datetime.now())
+                continue
+
+            with self._condition:
+                if not self.running:
+                    break
+                next_due = self.next_due_at()
+                timeout = self.resync_seconds - (now - last_resync).total_seconds()
+                if next_due is not None:
+                    timeout = min(timeout, (next_due - datetime.now()).total_seconds())
+                if timeout > 0:
+                    self._condition.wait(timeout)
+
+    def start(self):
+        with self._condition:
+            self.running = True
+            if self._thread and self._thread.is_alive():
+                return
+        self._thread = threading.Thread(target=self._run_safely, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self.running = False
+            # Rebuilt from the database on the next start()
+            self._heap = []
+            self._entries = {}
+            self._condition.notify()
+
+    def _run_safely(self):
+        try:
+            print("🕒 Background scheduler for missed activities running...")
+            self.run()
+        except Exception as e:
+            print(f"❌ Error in missed activities scheduler: {e}")
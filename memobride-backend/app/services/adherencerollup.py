@@ -0,0 +1,225 @@
+# app/services/adherencerollup.py
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from app import db
+from app.dbhelpers import upsert
+from app.models import UserActivity, ActivityCompletion, DailyAdherence
+from app.services.activityscheduler import parse_scheduled_time, weekday_bit
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def _is_medication():
+    # Same rule the chatbot uses to spot medications
+    return db.func.lower(UserActivity.activity_name).like('%medication%')
+
+
+def rollup_day(day):
+    """Write the adherence rows for one day with a single INSERT ... SELECT upsert.
+
+    A row is written for every activity that was scheduled that day (active,
+    weekday bit set, created by the end of the day) and for any activity
+    completed that day even if it was not scheduled. Re-running a day
+    overwrites its rows, so late completions synced from offline clients are
+    picked up by the next run that covers the day.
+    """
+    next_midnight = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    scheduled = db.and_(
+        UserActivity.is_active == True,
+        UserActivity.days_mask.op('&')(weekday_bit(day.isoweekday())) != 0,
+        UserActivity.created_at < next_midnight
+    )
+    completed = ActivityCompletion.id.isnot(None)
+
+    source = db.select(
+        UserActivity.user_id,
+        UserActivity.id,
+        db.literal(day, db.Date),
+        scheduled,
+        completed,
+        _is_medication(),
+        db.literal(datetime.utcnow(), db.DateTime)
+    ).select_from(UserActivity).outerjoin(
+        ActivityCompletion,
+        db.and_(
+            ActivityCompletion.activity_id == UserActivity.id,
+            ActivityCompletion.completed_on == day
+        )
+    ).where(db.or_(scheduled, completed))
+
+    statement = upsert(
+        DailyAdherence, ['activity_id', 'day'],
+        ['scheduled', 'completed', 'is_medication', 'rolled_up_at']
+    ).from_select(
+        ['user_id', 'activity_id', 'day', 'scheduled', 'completed', 'is_medication', 'rolled_up_at'], source
+    )
+    written = db.session.execute(statement).rowcount
+    db.session.commit()
+    return written
+
+
+class AdherenceRollup:
+    """Nightly, incremental rollup of ActivityCompletion into DailyAdherence.
+
+    Each run continues from the last rolled-up day and re-rolls the previous
+    ADHERENCE_ROLLUP_LOOKBACK_DAYS days so completions recorded late still
+    count. The first run backfills at most ADHERENCE_ROLLUP_MAX_BACKFILL_DAYS.
+    Today is never rolled up because it is not over yet.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.running = False
+        self.run_at = parse_scheduled_time(os.environ.get('ADHERENCE_ROLLUP_TIME', '00:15'))
+        self.lookback_days = int(os.environ.get('ADHERENCE_ROLLUP_LOOKBACK_DAYS', 3))
+        self.max_backfill_days = int(os.environ.get('ADHERENCE_ROLLUP_MAX_BACKFILL_DAYS', 365))
+        self.last_run = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def pending_days(self, today=None):
+        """Days the next run should roll up, oldest first"""
+        today = today or date.today()
+        last_day = db.session.query(db.func.max(DailyAdherence.day)).scalar()
+        if last_day is None:
+            first_activity = db.session.query(db.func.min(UserActivity.created_at)).scalar()
+            if first_activity is None:
+                return []
+            start = max(first_activity.date(), today - timedelta(days=self.max_backfill_days))
+        else:
+            start = last_day + timedelta(days=1) - timedelta(days=self.lookback_days)
+
+        return [start + timedelta(days=offset) for offset in range((today - start).days)]
+
+    def run_once(self, today=None):
+        """Roll up every pending day; returns the number of rows written"""
+        with self.app.app_context():
+            days = self.pending_days(today)
+            written = sum(rollup_day(day) for day in days)
+
+        self.last_run = {
+            'finished_at': datetime.utcnow().isoformat(),
+            'days': len(days),
+            'from': days[0].isoformat() if days else None,
+            'to': days[-1].isoformat() if days else None,
+            'rows': written
+        }
+        if days:
+            print(f"📈 Adherence rollup: {written} rows for {len(days)} days ({days[0]} to {days[-1]})")
+        return written
+
+    def seconds_until_next_run(self, now=None):
+        now = now or datetime.now()
+        next_run = datetime.combine(now.date(), self.run_at or datetime.min.time())
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    def run(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Error in adherence rollup: {e}")
+
+            self._wake.wait(self.seconds_until_next_run())
+            self._wake.clear()
+
+    def start(self):
+        self.running = True
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+
+
+def _bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _ratio(completed, scheduled):
+    return round(completed / scheduled, 4) if scheduled else None
+
+
+def history_per_day_query(user_id, start, end):
+    """(day, scheduled, completed, medication scheduled, medication completed) per day in the range"""
+    scheduled_done = db.and_(DailyAdherence.scheduled == True, DailyAdherence.completed == True)
+    return db.session.query(
+        DailyAdherence.day,
+        db.func.sum(db.case((DailyAdherence.scheduled == True, 1), else_=0)),
+        db.func.sum(db.case((scheduled_done, 1), else_=0)),
+        db.func.sum(db.case((db.and_(DailyAdherence.scheduled == True, DailyAdherence.is_medication == True), 1),
+                            else_=0)),
+        db.func.sum(db.case((db.and_(scheduled_done, DailyAdherence.is_medication == True), 1), else_=0))
+    ).filter(
+        DailyAdherence.user_id == user_id,
+        DailyAdherence.day.between(start, end)
+    ).group_by(DailyAdherence.day).order_by(DailyAdherence.day)
+
+
+def adherence_history(user_id, start, end, granularity='day'):
+    """Adherence per day/week/month between start and end (inclusive), read from the rollup only.
+
+    The range query walks the (user_id, day) index, so its cost depends on the
+    range asked for, not on how much history the user has.
+    """
+    scheduled_done = db.and_(DailyAdherence.scheduled == True, DailyAdherence.completed == True)
+    per_day = history_per_day_query(user_id, start, end).all()
+
+    buckets = {}
+    for day, scheduled, completed, medication_scheduled, medication_completed in per_day:
+        bucket = buckets.setdefault(_bucket_start(day, granularity), [0, 0, 0, 0])
+        bucket[0] += scheduled or 0
+        bucket[1] += completed or 0
+        bucket[2] += medication_scheduled or 0
+        bucket[3] += medication_completed or 0
+
+    per_activity = db.session.query(
+        DailyAdherence.activity_id,
+        UserActivity.activity_name,
+        db.func.sum(db.case((DailyAdherence.scheduled == True, 1), else_=0)),
+        db.func.sum(db.case((scheduled_done, 1), else_=0))
+    ).join(
+        UserActivity, UserActivity.id == DailyAdherence.activity_id
+    ).filter(
+        DailyAdherence.user_id == user_id,
+        DailyAdherence.day.between(start, end)
+    ).group_by(DailyAdherence.activity_id, UserActivity.activity_name).all()
+
+    totals = [sum(bucket[index] for bucket in buckets.values()) for index in range(4)]
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'granularity': granularity,
+        'scheduled': totals[0],
+        'completed': totals[1],
+        'adherence': _ratio(totals[1], totals[0]),
+        'medication_adherence': _ratio(totals[3], totals[2]),
+        'buckets': [{
+            'start': bucket_start.isoformat(),
+            'scheduled': scheduled,
+            'completed': completed,
+            'adherence': _ratio(completed, scheduled),
+            'medication_scheduled': medication_scheduled,
+            'medication_completed': medication_completed,
+            'medication_adherence': _ratio(medication_completed, medication_scheduled)
+        } for bucket_start, (scheduled, completed, medication_scheduled, medication_completed)
+            in sorted(buckets.items())],
+        'activities': [{
+            'activity_id': activity_id,
+            'name': name,
+            'scheduled': scheduled or 0,
+            'completed': completed or 0,
+            'adherence': _ratio(completed or 0, scheduled or 0)
+        } for activity_id, name, scheduled, completed in per_activity]
+    }
@@ -1,10 +1,9 @@
 # app/services/chatbotservice.py
 import os
 import json
-from datetime import datetime, date
+from datetime import datetime
 from flask import current_app
-from app.models import User, FamilyMember, UserActivity, ActivityCompletion
-from app import db
+from app.models import User, FamilyMember
 
 
 class ChatBotService:
@@ -27,23 +26,14 @@ class ChatBotService:
             if not user:
                 return None
 
-            # Get today's activities and completions
-            today = date.today()
-            user_activities = UserActivity.query.filter_by(user_id=user_id).all()
-
-            activities_info = []
-            for activity in user_activities:
-                completion = ActivityCompletion.query.filter(
-                    ActivityCompletion.activity_id == activity.id,
-                    db.func.date(ActivityCompletion.completed_at) == today
-                ).first()
-
-                activities_info.append({
-                    'name': activity.activity_name,
-                    'scheduled_time': activity.scheduled_time,
-                    'completed': completion is not None,
-                    'is_medication': 'medication' in activity.activity_name.lower()
-                })
+            # Today's activities and completions, from the per-user schedule cache
+            schedule = current_app.schedule_cache.get(user_id)
+            activities_info = [{
+                'name': entry['name'],
+                'scheduled_time': entry['scheduled_time'],
+                'completed': entry['completed'],
+                'is_medication': 'medication' in entry['name'].lower()
+            } for entry in schedule['activities']]
 
             # Get family members
             family_members = FamilyMember.query.filter_by(user_id=user_id).all()
@@ -0,0 +1,59 @@
+# app/services/defaultactivities.py
+from datetime import datetime
+
+from app import db
+from app.models import User, UserActivity
+from app.services.activityscheduler import days_to_mask
+
+# Every new user starts with this daily routine
+DEFAULT_ACTIVITIES = [
+    {'activity_name': 'Morning Medication', 'scheduled_time': '09:00', 'days_of_week': '1,2,3,4,5,6,7'},
+    {'activity_name': 'Lunch with Family', 'scheduled_time': '12:00', 'days_of_week': '1,2,3,4,5,6,7'},
+    {'activity_name': 'Afternoon Rest', 'scheduled_time': '14:00', 'days_of_week': '1,2,3,4,5,6,7'},
+    {'activity_name': 'Evening Medication', 'scheduled_time': '18:00', 'days_of_week': '1,2,3,4,5,6,7'},
+    {'activity_name': 'Dinner with Family', 'scheduled_time': '19:00', 'days_of_week': '1,2,3,4,5,6,7'},
+]
+
+
+def provision_default_activities(user_ids):
+    """Insert the default activities for these users in one statement, in the current transaction.
+
+    This is a Core insert, so the days_of_week validator does not run and
+    days_mask is filled in here. Returns the number of activities inserted.
+    """
+    from app.conditional import bump_data_version
+
+    user_ids = [int(user_id) for user_id in user_ids]
+    if not user_ids:
+        return 0
+
+    now = datetime.utcnow()
+    rows = [{
+        'user_id': user_id,
+        'activity_name': activity['activity_name'],
+        'scheduled_time': activity['scheduled_time'],
+        'days_of_week': activity['days_of_week'],
+        'days_mask': days_to_mask(activity['days_of_week']),
+        'is_active': True,
+        'created_at': now
+    } for user_id in user_ids for activity in DEFAULT_ACTIVITIES]
+
+    db.session.execute(db.insert(UserActivity), rows)
+    bump_data_version(*user_ids)
+    return len(rows)
+
+
+def users_without_activities():
+    """Ids of users that have no activities at all, found with one anti-join"""
+    has_activity = db.exists().where(UserActivity.user_id == User.id)
+    return [row[0] for row in db.session.query(User.id).filter(~has_activity).order_by(User.id)]
+
+
+def backfill_default_activities(batch_size=500):
+    """Give every user without activities the defaults; commits per batch, returns (users, activities)"""
+    user_ids = users_without_activities()
+    activities = 0
+    for start in range(0, len(user_ids), batch_size):
+        activities += provision_default_activities(user_ids[start:start + batch_size])
+        db.session.commit()
+    return len(user_ids), activities
@@ -0,0 +1,61 @@
+# app/services/emailtemplates.py
+import os
+from functools import lru_cache
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+from markupsafe import Markup
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'email')
+
+# Each email is made of <name>.subject.txt, <name>.txt and <name>.html
+EMAIL_TEMPLATES = ('welcome', 'family_alert', 'family_digest', 'user_alert')
+
+# Static, per-locale strings used by the shared footer
+LOCALE_STRINGS = {
+    'en': {
+        'team_name': 'Memobridge Care Team',
+        'footer_note': "You are receiving this email because you are part of a Memobridge care team."
+    }
+}
+DEFAULT_LOCALE = 'en'
+
+
+class EmailTemplates:
+    """Email templates compiled once at startup and rendered with HTML escaping.
+
+    The footer does not depend on the message, so it is rendered once per
+    locale and cached; each message only renders its own subject and bodies.
+    """
+
+    def __init__(self, template_folder=TEMPLATE_FOLDER):
+        self.env = Environment(
+            loader=FileSystemLoader(template_folder),
+            autoescape=select_autoescape(enabled_extensions=('html',), default_for_string=False),
+            undefined=StrictUndefined,
+            keep_trailing_newline=False
+        )
+
+        # Compile everything up front so a broken template fails at startup, not mid fan-out
+        self._templates = {}
+        for name in EMAIL_TEMPLATES:
+            for part in ('subject.txt', 'txt', 'html'):
+                self._templates[(name, part)] = self.env.get_template(f'{name}.{part}')
+        self._footer_html = self.env.get_template('_footer.html')
+        self._footer_text = self.env.get_template('_footer.txt')
+
+    @lru_cache(maxsize=16)
+    def static_parts(self, locale):
+        """Rendered footer for a locale, cached after the first message"""
+        strings = LOCALE_STRINGS.get(locale, LOCALE_STRINGS[DEFAULT_LOCALE])
+        return {
+            'footer_html': Markup(self._footer_html.render(strings=strings)),
+            'footer_text': self._footer_text.render(strings=strings)
+        }
+
+    def render(self, name, locale=DEFAULT_LOCALE, **context):
+        """Render an email; returns (subject, plain, html)"""
+        context.update(self.static_parts(locale))
+        subject = self._templates[(name, 'subject.txt')].render(**context).strip()
+        plain = self._templates[(name, 'txt')].render(**context)
+        html = self._templates[(name, 'html')].render(**context)
+        return subject, plain, html
@@ -0,0 +1,69 @@
+# app/services/jobrunner.py
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import BackgroundJob
+
+
+class JobRunner:
+    """Bounded thread pool for work that should not run on the request path.
+
+    Each submitted job gets an id whose status (queued, running, succeeded,
+    failed) and result can be polled later. Status lives in the
+    background_job table, so a poll can land on any worker process, not only
+    the one that accepted the job. Records older than JOB_RETENTION_HOURS are
+    pruned as new jobs arrive.
+    """
+
+    def __init__(self, app, max_workers=4, retention_hours=None):
+        self.app = app
+        self.retention = timedelta(hours=retention_hours or int(os.environ.get('JOB_RETENTION_HOURS', 24)))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, name, func, *args, owner_id=None, **kwargs):
+        """Run func(*args, **kwargs) inside an app context in the pool; returns the job id"""
+        job_id = uuid.uuid4().hex
+
+        # Own app context, so the job row never commits the caller's pending session
+        with self.app.app_context():
+            BackgroundJob.query.filter(BackgroundJob.created_at < datetime.utcnow() - self.retention).delete(
+                synchronize_session=False)
+            db.session.add(BackgroundJob(
+                id=job_id,
+                name=name,
+                owner_id=str(owner_id) if owner_id is not None else None,
+                status='queued'
+            ))
+            db.session.commit()
+
+        self._executor.submit(self._run, job_id, name, func, args, kwargs)
+        return job_id
+
+    def get(self, job_id):
+        with self.app.app_context():
+            job = BackgroundJob.query.get(job_id)
+            return job.to_dict() if job else None
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait)
+
+    def _update(self, job_id, **values):
+        with self.app.app_context():
+            BackgroundJob.query.filter_by(id=job_id).update(values, synchronize_session=False)
+            db.session.commit()
+
+    def _run(self, job_id, name, func, args, kwargs):
+        try:
+            self._update(job_id, status='running')
+            with self.app.app_context():
+                result = func(*args, **kwargs)
+            self._update(job_id, status='succeeded', result=result, finished_at=datetime.utcnow())
+        except Exception as e:
+            print(f"❌ Background job {name} failed: {e}")
+            try:
+                self._update(job_id, status='failed', error=str(e)[:500], finished_at=datetime.utcnow())
+            except Exception as update_error:
+                print(f"❌ Could not record failure of job {job_id}: {update_error}")
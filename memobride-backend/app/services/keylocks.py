@@ -0,0 +1,26 @@
+# app/services/keylocks.py
+import threading
+from contextlib import contextmanager
+
+
+class KeyLocks:
+    """One lock per key, created on demand and dropped when nobody holds or waits for it"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
@@ -0,0 +1,54 @@
+# app/services/leaderlease.py
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from app import db
+from app.dbhelpers import insert_ignoring_conflicts
+from app.models import ServiceLease
+
+
+class LeaderLease:
+    """DB-backed leader lease with heartbeat and expiry.
+
+    Every process calls `try_acquire` on each heartbeat. The holder extends its
+    lease; any other process only wins once the lease has expired, i.e. when
+    the leader stopped heart-beating for `ttl_seconds`. Acquisition is a single
+    conditional UPDATE, so two processes can never both hold the lease.
+    """
+
+    def __init__(self, app, name, ttl_seconds=None, heartbeat_seconds=None):
+        self.app = app
+        self.name = name
+        self.ttl_seconds = ttl_seconds or int(os.environ.get('LEADER_LEASE_TTL_SECONDS', 30))
+        self.heartbeat_seconds = heartbeat_seconds or int(os.environ.get('LEADER_LEASE_HEARTBEAT_SECONDS', 10))
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def try_acquire(self, now=None):
+        """Take or renew the lease; returns True while this process is the leader"""
+        now = now or datetime.utcnow()
+        with self.app.app_context():
+            # Make sure the lease row exists, without touching it if it does
+            db.session.execute(insert_ignoring_conflicts(ServiceLease, ['name']).values(
+                name=self.name, holder=None, expires_at=datetime.min))
+
+            acquired = ServiceLease.query.filter(
+                ServiceLease.name == self.name,
+                db.or_(ServiceLease.holder == self.holder,
+                       ServiceLease.holder.is_(None),
+                       ServiceLease.expires_at < now)
+            ).update({
+                'holder': self.holder,
+                'expires_at': now + timedelta(seconds=self.ttl_seconds),
+                'heartbeat_at': now
+            }, synchronize_session=False)
+            db.session.commit()
+            return acquired == 1
+
+    def release(self):
+        """Give the lease up immediately so another process can take over"""
+        with self.app.app_context():
+            ServiceLease.query.filter_by(name=self.name, holder=self.holder).update(
+                {'holder': None, 'expires_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
@@ -0,0 +1,205 @@
+# app/services/mailqueue.py
+import queue
+import smtplib
+import threading
+import time as time_module
+
+from app.services import metrics
+
+
+class MailQueue:
+    """Bounded outbound mail queue served by a small pool of SMTP workers.
+
+    Each worker keeps its own SMTP session open between messages, checks it
+    with NOOP before reusing it after an idle period, and sends every message
+    it can drain from the queue (up to batch_size) over that one session.
+    `enqueue` never blocks the caller; it returns False when the queue is full.
+
+    `smtp_factory` defaults to smtplib.SMTP and can be swapped for a stub, or
+    pointed at a local stand-in server such as aiosmtpd with use_tls off.
+
+    Every pool has its own stop event, so a pool started after stop() never
+    shares the queue with workers of the old one that were still finishing.
+    """
+
+    def __init__(self, smtp_config, workers=2, max_queue_size=1000, batch_size=20,
+                 idle_timeout=60, health_check_after=30, smtp_factory=None):
+        self.smtp_config = smtp_config
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.smtp_factory = smtp_factory or smtplib.SMTP
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads = []
+        self._stopping = None  # stop event of the running pool
+        self._lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        """Start the worker pool (idempotent)"""
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self._stopping = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._worker, args=(self._stopping,), name=f'mail-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the workers after they finish the message in hand; waits up to timeout for them"""
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+            self._stopping.set()
+            threads, self._threads = self._threads, []
+
+        # Wake idle workers instead of waiting out their idle_timeout
+        for _ in threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break  # busy workers see the stop event after their batch
+        deadline = time_module.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time_module.monotonic()))
+
+    def enqueue(self, msg, on_result=None):
+        """Queue a prepared email.message.Message without waiting for delivery.
+
+        on_result(success, error) is called from the worker thread once the
+        message has been handed to the SMTP server or has failed.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((msg, on_result))
+            return True
+        except queue.Full:
+            print(f"⚠️ Mail queue full, dropping email to {msg['To']}")
+            return False
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Block until every queued message has been processed (for scripts and tests)"""
+        self._queue.join()
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+
+    def _connect(self):
+        config = self.smtp_config
+        with metrics.smtp_connect_duration.time():
+            server = self.smtp_factory(config['server'], config['port'], timeout=config.get('timeout', 30))
+            if config.get('use_tls', True):
+                server.starttls()
+            if config.get('username'):
+                server.login(config['username'], config['password'])
+        metrics.smtp_connections.inc()
+        return server
+
+    def _close(self, server):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _is_healthy(self, server):
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _worker(self, stopping):
+        server = None
+        last_used = 0.0
+
+        while not stopping.is_set():
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # Nothing to send for a while, release the session
+                self._close(server)
+                server = None
+                continue
+
+            batch = []
+            taken = 1
+            if item is not None:  # None is the wake-up sent by stop()
+                batch.append(item)
+            while len(batch) < self.batch_size and not stopping.is_set():
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if item is not None:
+                    batch.append(item)
+
+            try:
+                if batch:
+                    server = self._send_batch(server, batch, last_used)
+                    last_used = time_module.monotonic()
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+        self._close(server)
+
+    def _send_batch(self, server, batch, last_used):
+        """Send a batch over one session, reconnecting once if the session drops"""
+        if server is not None and time_module.monotonic() - last_used > self.health_check_after:
+            if not self._is_healthy(server):
+                self._close(server)
+                server = None
+
+        for msg, on_result in batch:
+            error = None
+            for attempt in range(2):
+                try:
+                    if server is None:
+                        server = self._connect()
+                    with metrics.smtp_send_duration.time():
+                        server.send_message(msg)
+                    error = None
+                    break
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    # Rejected message, the session itself is still usable
+                    error = e
+                    break
+                except OSError as e:
+                    # Stale or broken session: drop it and retry once on a fresh one
+                    error = e
+                    self._close(server)
+                    server = None
+                except Exception as e:
+                    error = e
+                    break
+
+            if error is None:
+                metrics.smtp_messages.inc(outcome='sent')
+                print(f"✅ Email sent to: {msg['To']}")
+            else:
+                metrics.smtp_messages.inc(outcome='failed')
+                print(f"❌ Failed to send email to {msg['To']}: {error}")
+
+            if on_result:
+                try:
+                    on_result(error is None, error)
+                except Exception as e:
+                    print(f"❌ Mail result callback failed: {e}")
+
+        return server
@@ -0,0 +1,220 @@
+# app/services/metrics.py
+import bisect
+import threading
+import time as time_module
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in pairs)
+    return '{' + body + '}'
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Gauge set directly, or read from a callback at scrape time (e.g. a queue depth)"""
+    type_name = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._callback = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, callback):
+        self._callback = callback
+
+    def render(self):
+        if self._callback is not None:
+            try:
+                self.set(self._callback())
+            except Exception:
+                pass
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time_module.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time_module.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, *args, **kwargs):
+        return self._register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self._register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self._register(Histogram(*args, **kwargs))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# ----------------------------------------------------------------------
+# Query counting: a single engine hook that only does work on threads that
+# opted in through count_queries(), so normal requests pay one attribute check.
+# ----------------------------------------------------------------------
+
+_query_counter = threading.local()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counts = getattr(_query_counter, 'counts', None)
+    if counts is not None:
+        counts[0] += 1
+
+
+@contextmanager
+def count_queries():
+    """Count SQL statements run on this thread; yields a one-item list holding the count"""
+    previous = getattr(_query_counter, 'counts', None)
+    counts = [0]
+    _query_counter.counts = counts
+    try:
+        yield counts
+    finally:
+        _query_counter.counts = previous
+        if previous is not None:
+            previous[0] += counts[0]
+
+
+registry = MetricsRegistry()
+
+# Notification pipeline
+sweep_duration = registry.histogram(
+    'memobridge_notification_sweep_seconds', 'Duration of missed-activity sweeps and scheduler batches', ['kind'])
+sweep_queries = registry.histogram(
+    'memobridge_notification_sweep_queries', 'SQL statements run per sweep or scheduler batch', ['kind'],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000))
+activities_evaluated = registry.counter(
+    'memobridge_notification_activities_evaluated_total', 'Due-but-incomplete activities evaluated', ['kind'])
+user_evaluation_duration = registry.histogram(
+    'memobridge_notification_user_evaluation_seconds', 'Duration of single-user missed-activity checks')
+notifications_queued = registry.counter(
+    'memobridge_notifications_queued_total', 'Notifications written to the outbox', ['channel'])
+outbox_pending = registry.gauge(
+    'memobridge_notification_outbox_pending', 'Outbox rows pending or being sent')
+
+# SMTP delivery
+smtp_connect_duration = registry.histogram(
+    'memobridge_smtp_connect_seconds', 'Time to open, secure and authenticate an SMTP session')
+smtp_send_duration = registry.histogram(
+    'memobridge_smtp_send_seconds', 'Time to hand one message to the SMTP server')
+smtp_messages = registry.counter(
+    'memobridge_smtp_messages_total', 'Messages handed to SMTP by outcome', ['outcome'])
+smtp_connections = registry.counter(
+    'memobridge_smtp_connections_total', 'SMTP sessions opened')
+mail_queue_depth = registry.gauge(
+    'memobridge_mail_queue_depth', 'Messages waiting in the outbound mail queue')
+
+# Photo resizing
+resize_cache_requests = registry.counter(
+    'memobridge_photo_resize_cache_requests_total', 'Resized-photo requests by cache outcome', ['outcome'])
+resize_cache_evictions = registry.counter(
+    'memobridge_photo_resize_cache_evictions_total', 'Resized photos evicted to stay under the size limit')
+resize_cache_bytes = registry.gauge(
+    'memobridge_photo_resize_cache_bytes', 'Bytes of resized photos on disk')
+resize_duration = registry.histogram(
+    'memobridge_photo_resize_seconds', 'Time to decode, resize and encode one photo on a cache miss')
@@ -0,0 +1,124 @@
+# app/services/missedactivities.py
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import User, UserActivity, ActivityCompletion
+from app.services.activityscheduler import (
+    USER_ALERT, FAMILY_ALERT,
+    USER_ALERT_DELAY, USER_ALERT_WINDOW_END,
+    FAMILY_ALERT_DELAY, FAMILY_ALERT_WINDOW_END,
+    parse_scheduled_time, weekday_bit
+)
+
+# One due-but-incomplete activity and the alert stage it is in
+MissedActivityRow = namedtuple('MissedActivityRow', ['activity', 'user', 'stage', 'scheduled_at'])
+
+
+def _minute_bounds(now, window_start, window_end):
+    """Turn an offset window behind now into inclusive "HH:MM" bounds for today.
+
+    An activity is inside the window when window_start <= now - scheduled <= window_end,
+    so scheduled must lie in [now - window_end, now - window_start]. The lower bound is
+    rounded up and the upper bound down to whole minutes so string comparison on the
+    stored "HH:MM" values matches the datetime comparison exactly.
+    """
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    lower = now - window_end
+    upper = now - window_start
+    if upper < midnight:
+        return None
+
+    lower = max(lower, midnight)
+    if lower.second or lower.microsecond:
+        lower = lower.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    return lower.strftime('%H:%M'), upper.strftime('%H:%M')
+
+
+def _scheduled_on_weekday(weekday):
+    """SQL predicate: the weekday's bit is set in days_mask"""
+    return UserActivity.days_mask.op('&')(weekday_bit(weekday)) != 0
+
+
+def due_incomplete_activities_query(now, user_ids=None, force_notify=False, shard=None):
+    """The (UserActivity, User) query behind find_due_incomplete_activities, or None when no window is open"""
+    today = now.date()
+
+    query = db.session.query(UserActivity, User).join(
+        User, User.id == UserActivity.user_id
+    ).outerjoin(
+        ActivityCompletion,
+        db.and_(
+            ActivityCompletion.activity_id == UserActivity.id,
+            ActivityCompletion.completed_on == today
+        )
+    ).filter(
+        UserActivity.is_active == True,
+        ActivityCompletion.id.is_(None),
+        _scheduled_on_weekday(now.isoweekday())
+    )
+
+    if user_ids is not None:
+        query = query.filter(UserActivity.user_id.in_(user_ids))
+
+    if shard is not None:
+        shard_index, shard_count = shard
+        query = query.filter(UserActivity.user_id % shard_count == shard_index)
+
+    if not force_notify:
+        windows = [
+            bounds for bounds in (
+                _minute_bounds(now, USER_ALERT_DELAY, USER_ALERT_WINDOW_END),
+                _minute_bounds(now, FAMILY_ALERT_DELAY, FAMILY_ALERT_WINDOW_END)
+            ) if bounds
+        ]
+        if not windows:
+            return None
+        query = query.filter(db.or_(*[
+            UserActivity.scheduled_time.between(lower, upper) for lower, upper in windows
+        ]))
+
+    return query
+
+
+def find_due_incomplete_activities(now=None, user_ids=None, force_notify=False, shard=None):
+    """Return every active activity that is due today, still incomplete and inside an alert window.
+
+    One set-based query covers all users: activities LEFT JOIN today's completions,
+    filtered by weekday and by the user/family alert windows. With force_notify the
+    window filter is dropped (the login check alerts on anything still open today).
+    shard=(index, count) restricts the query to users with user_id % count == index.
+    """
+    now = now or datetime.now()
+    today = now.date()
+
+    query = due_incomplete_activities_query(now, user_ids, force_notify, shard)
+    if query is None:
+        return []
+
+    results = []
+    for activity, user in query.all():
+        scheduled = parse_scheduled_time(activity.scheduled_time)
+        if scheduled is None:
+            print(f"❌ Invalid time format for activity {activity.activity_name}: {activity.scheduled_time}")
+            continue
+
+        scheduled_at = datetime.combine(today, scheduled)
+        since = now - scheduled_at
+        if force_notify or USER_ALERT_DELAY <= since <= USER_ALERT_WINDOW_END:
+            stage = USER_ALERT
+        elif FAMILY_ALERT_DELAY <= since <= FAMILY_ALERT_WINDOW_END:
+            stage = FAMILY_ALERT
+        else:
+            continue
+        results.append(MissedActivityRow(activity, user, stage, scheduled_at))
+
+    return results
+
+
+def completed_activity_ids_query(activity_ids, day):
+    """Which of activity_ids already have a completion on day"""
+    return db.session.query(ActivityCompletion.activity_id).filter(
+        ActivityCompletion.activity_id.in_(activity_ids),
+        ActivityCompletion.completed_on == day
+    )
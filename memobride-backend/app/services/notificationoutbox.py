@@ -0,0 +1,267 @@
+# app/services/notificationoutbox.py
+import os
+import threading
+from datetime import datetime, timedelta
+
+from app import db
+from app.dbhelpers import insert_ignoring_conflicts
+from app.models import NotificationOutbox
+from app.services import metrics
+
+
+# Family alerts on this channel prefix are held until their window closes and sent as one digest
+DIGEST_CHANNEL_PREFIX = 'family-digest:'
+
+
+def digest_window_end(now, window_minutes):
+    """End of the fixed-size window that contains now (windows start at midnight)"""
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    window = timedelta(minutes=window_minutes)
+    return midnight + ((now - midnight) // window + 1) * window
+
+
+def outbox_key(user_id, activity_id, activity_date, channel):
+    """Idempotency key for one notification: (user, activity, date, channel)"""
+    return f"{user_id}:{activity_id}:{activity_date}:{channel}"
+
+
+def add_to_outbox(user_id, activity_id, activity_date, channel, recipient, subject, body_text, body_html=None,
+                  send_after=None):
+    """Insert a pending outbox row in the current session unless its key already exists.
+
+    Returns True when a new row was written. The insert is a single
+    ON CONFLICT DO NOTHING statement, so concurrent workers and restarts
+    cannot queue the same notification twice. send_after holds the row
+    back until that instant (used to coalesce digests).
+    """
+    statement = insert_ignoring_conflicts(NotificationOutbox, ['idempotency_key']).values(
+        idempotency_key=outbox_key(user_id, activity_id, activity_date, channel),
+        user_id=user_id,
+        activity_id=activity_id,
+        activity_date=activity_date,
+        channel=channel,
+        recipient=recipient,
+        subject=subject,
+        body_text=body_text,
+        body_html=body_html,
+        status='pending',
+        attempts=0,
+        next_attempt_at=send_after or datetime.utcnow(),
+        created_at=datetime.utcnow()
+    )
+    created = db.session.execute(statement).rowcount > 0
+    if created:
+        metrics.notifications_queued.inc(channel=channel.split(':', 1)[0])
+    return created
+
+
+def due_outbox_query(now, limit):
+    """Pending rows whose next attempt is due, oldest first"""
+    return NotificationOutbox.query.filter(
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.next_attempt_at <= now
+    ).order_by(NotificationOutbox.next_attempt_at).limit(limit)
+
+
+def with_whole_digests(rows, now):
+    """rows plus every other due pending row on their digest channels, so no digest is split by the limit"""
+    channels = {row.channel for row in rows if row.channel.startswith(DIGEST_CHANNEL_PREFIX)}
+    if not channels:
+        return rows
+    seen = {row.id for row in rows}
+    rest = NotificationOutbox.query.filter(
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.next_attempt_at <= now,
+        NotificationOutbox.channel.in_(channels),
+        NotificationOutbox.id.notin_(seen)
+    ).order_by(NotificationOutbox.next_attempt_at).all()
+    return rows + rest
+
+
+class OutboxDrainer:
+    """Background worker that moves due outbox rows into the mail queue.
+
+    Rows are claimed with a conditional UPDATE (pending -> sending) so only one
+    process sends each row. Failed sends go back to pending with exponential
+    backoff until max_attempts, after which they are marked failed.
+    """
+
+    def __init__(self, app, notification_service):
+        self.app = app
+        self.notification_service = notification_service
+        self.running = False
+
+        self.poll_seconds = float(os.environ.get('OUTBOX_POLL_SECONDS', 5))
+        self.batch_size = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+        self.max_attempts = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 6))
+        self.backoff_base = float(os.environ.get('OUTBOX_BACKOFF_SECONDS', 30))
+        self.backoff_max = float(os.environ.get('OUTBOX_BACKOFF_MAX_SECONDS', 3600))
+        # Rows left in "sending" longer than this (e.g. after a crash) are retried
+        self.stuck_after = timedelta(seconds=int(os.environ.get('OUTBOX_STUCK_SECONDS', 600)))
+
+        self._wake = threading.Event()
+        self._thread = None
+
+    def backoff_for(self, attempts):
+        """Delay before retry number `attempts` (1-based): base * 2^(attempts - 1), capped"""
+        return timedelta(seconds=min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max))
+
+    def wake(self):
+        """Drain now instead of waiting for the next poll"""
+        self._wake.set()
+
+    def recover_stuck(self, now=None):
+        now = now or datetime.utcnow()
+        with self.app.app_context():
+            recovered = NotificationOutbox.query.filter(
+                NotificationOutbox.status == 'sending',
+                NotificationOutbox.next_attempt_at <= now - self.stuck_after
+            ).update({'status': 'pending'}, synchronize_session=False)
+            db.session.commit()
+        if recovered:
+            print(f"♻️ Recovered {recovered} outbox rows stuck in sending")
+        return recovered
+
+    def drain_once(self, now=None):
+        """Claim due pending rows and queue them for delivery; returns the number claimed"""
+        now = now or datetime.utcnow()
+        with self.app.app_context():
+            # A digest channel is claimed whole even when that goes past batch_size
+            due = with_whole_digests(due_outbox_query(now, self.batch_size).all(), now)
+
+            claimed = []
+            for row in due:
+                updated = NotificationOutbox.query.filter_by(id=row.id, status='pending').update(
+                    {'status': 'sending', 'next_attempt_at': now}, synchronize_session=False)
+                if updated:
+                    claimed.append(row)
+
+            messages = self._build_messages(claimed)
+            db.session.commit()
+
+        for outbox_ids, recipient, subject, body_text, body_html in messages:
+            queued = self.notification_service.send_email(
+                recipient, subject, body_text, body_html,
+                on_result=lambda success, error, outbox_ids=outbox_ids: self.record_results(outbox_ids, success, error)
+            )
+            if not queued:
+                self.record_results(outbox_ids, False, 'mail queue full')
+
+        return len(claimed)
+
+    def _build_messages(self, rows):
+        """Turn claimed rows into (outbox_ids, recipient, subject, text, html) emails.
+
+        Digest-channel rows for the same family member are merged into one
+        email listing every missed item; everything else is sent as stored.
+        """
+        from app.models import User, FamilyMember, UserActivity
+
+        messages = []
+        digests = {}
+        for row in rows:
+            if row.channel.startswith(DIGEST_CHANNEL_PREFIX):
+                digests.setdefault(row.channel, []).append(row)
+            else:
+                messages.append(([row.id], row.recipient, row.subject, row.body_text, row.body_html))
+
+        groups = [group for group in digests.values() if len(group) > 1]
+        for group in digests.values():
+            if len(group) == 1:
+                row = group[0]
+                messages.append(([row.id], row.recipient, row.subject, row.body_text, row.body_html))
+
+        if not groups:
+            return messages
+
+        grouped_rows = [row for group in groups for row in group]
+        activities = {activity.id: activity for activity in UserActivity.query.filter(
+            UserActivity.id.in_({row.activity_id for row in grouped_rows})).all()}
+        users = {user.id: user for user in User.query.filter(
+            User.id.in_({row.user_id for row in grouped_rows})).all()}
+        members = {member.id: member for member in FamilyMember.query.filter(
+            FamilyMember.id.in_({int(group[0].channel[len(DIGEST_CHANNEL_PREFIX):]) for group in groups})).all()}
+
+        for group in groups:
+            first = group[0]
+            user = users.get(first.user_id)
+            member = members.get(int(first.channel[len(DIGEST_CHANNEL_PREFIX):]))
+            items = [
+                (activities[row.activity_id].activity_name, activities[row.activity_id].scheduled_time)
+                for row in group if row.activity_id in activities
+            ]
+            if not user or not member or len(items) != len(group):
+                # Missing context, fall back to the individual alerts
+                for row in group:
+                    messages.append(([row.id], row.recipient, row.subject, row.body_text, row.body_html))
+                continue
+
+            subject, body_text, body_html = self.notification_service.compose_family_digest(user, member, items)
+            print(f"🗞️ Coalesced {len(group)} family alerts for {member.email} into one digest")
+            messages.append(([row.id for row in group], first.recipient, subject, body_text, body_html))
+
+        return messages
+
+    def record_results(self, outbox_ids, success, error=None):
+        """Record one delivery outcome for every row that went out in the same email"""
+        for outbox_id in outbox_ids:
+            self.record_result(outbox_id, success, error)
+
+    def record_result(self, outbox_id, success, error=None):
+        """Mark a row sent, or schedule its retry with exponential backoff"""
+        with self.app.app_context():
+            row = NotificationOutbox.query.get(outbox_id)
+            if not row:
+                return
+
+            now = datetime.utcnow()
+            row.attempts += 1
+            if success:
+                row.status = 'sent'
+                row.sent_at = now
+                row.last_error = None
+            else:
+                row.last_error = str(error)[:500] if error else 'unknown error'
+                if row.attempts >= self.max_attempts:
+                    row.status = 'failed'
+                    print(f"❌ Outbox row {outbox_id} failed after {row.attempts} attempts")
+                else:
+                    row.status = 'pending'
+                    row.next_attempt_at = now + self.backoff_for(row.attempts)
+            db.session.commit()
+
+    def pending_count(self):
+        with self.app.app_context():
+            return NotificationOutbox.query.filter(
+                NotificationOutbox.status.in_(['pending', 'sending'])
+            ).count()
+
+    def run(self):
+        self.recover_stuck()
+        last_recovery = datetime.utcnow()
+
+        while self.running:
+            try:
+                if datetime.utcnow() - last_recovery >= self.stuck_after:
+                    self.recover_stuck()
+                    last_recovery = datetime.utcnow()
+
+                if self.drain_once() >= self.batch_size:
+                    # More rows are waiting, keep draining
+                    continue
+            except Exception as e:
+                print(f"❌ Error draining notification outbox: {e}")
+
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def start(self):
+        self.running = True
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
@@ -0,0 +1,264 @@
+# app/services/photohash.py
+#
+# 64-bit difference hashes (dHash) for finding burst shots and re-scans of the
+# same picture. Hashes are computed once at upload and stored on MemoryPhoto;
+# lookups go through a per-user BK-tree held in memory. A user's tree is
+# loaded from the database on first use, then updated in place by the uploads
+# and deletes this process handles, and topped up from the database only when
+# another process changed the user's photo hashes (User.photo_version).
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from app import db
+from app.services.keylocks import KeyLocks
+
+# Hamming distance at or below which two photos count as the same picture
+NEAR_DUPLICATE_DISTANCE = 6
+# Default and largest distance for "similar photos"
+SIMILAR_DISTANCE = 14
+MAX_SIMILAR_DISTANCE = 24
+
+_HASH_BITS = 64
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(value):
+        return bin(value).count('1')
+
+
+def hamming(a, b):
+    return _popcount(a ^ b)
+
+
+def dhash(path):
+    """Unsigned 64-bit dHash: 9x8 grayscale, one bit per left/right neighbour comparison"""
+    with Image.open(path) as image:
+        # Decoding a JPEG at 1/8 scale is plenty for a 9x8 thumbnail
+        image.draft('L', (64, 64))
+        image = ImageOps.exif_transpose(image)
+        pixels = list(image.convert('L').resize((9, 8), Image.Resampling.BOX).getdata())
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def to_signed(value):
+    """Store the unsigned hash in a signed 64-bit BIGINT column"""
+    return value - (1 << _HASH_BITS) if value >= 1 << (_HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value + (1 << _HASH_BITS) if value < 0 else value
+
+
+def bump_photo_version(*user_ids):
+    """Bump photo_version in the current transaction, for every write that adds or removes a stored hash"""
+    from app.models import User
+
+    ids = {int(user_id) for user_id in user_ids if user_id is not None}
+    if ids:
+        db.session.execute(
+            db.update(User).where(User.id.in_(ids)).values(photo_version=User.photo_version + 1)
+        )
+
+
+def current_photo_version(user_id):
+    from app.models import User
+    return db.session.query(User.photo_version).filter(User.id == int(user_id)).scalar()
+
+
+def hash_for_upload(blob_id, path):
+    """Column value for a new upload: an identical earlier upload's hash, else the file's; None if unreadable"""
+    from app.models import MemoryPhoto
+
+    known = db.session.query(MemoryPhoto.dhash).filter(
+        MemoryPhoto.blob_id == blob_id, MemoryPhoto.dhash.isnot(None)
+    ).limit(1).scalar()
+    if known is not None:
+        return known
+    try:
+        return to_signed(dhash(path))
+    except Exception as e:
+        # Unreadable, truncated or a decompression bomb: the upload still succeeds, unhashed
+        print(f"⚠️ Cannot hash {path}: {e}")
+        return None
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance; photos with the same hash share a node.
+
+    Searching with radius r only descends into children whose edge distance
+    lies within r of the query's distance to the node, which prunes most of
+    the tree for the small radii used here.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, set of photo ids, {distance: child}]
+
+    def add(self, value, photo_id):
+        if self._root is None:
+            self._root = [value, {photo_id}, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].add(photo_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {photo_id}, {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """[(distance, photo id)] within radius, nearest first"""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                matches.extend((distance, photo_id) for photo_id in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        matches.sort()
+        return matches
+
+
+class PhotoSimilarityIndex:
+    """Per-user BK-trees of photo hashes, most recently used users kept in memory.
+
+    Each tree is stamped with the user's photo_version, which every upload,
+    delete and `hash-photos` write of a hash bumps by one. This process adds
+    its own uploads to the tree and marks its own deletes, and moves the
+    stamp along when its write was the only one. A lookup reads the counter
+    and only when another process moved it are the user's hashed rows
+    re-read and the missing ones added; unrelated writes such as completions
+    or game results leave the tree alone. Deleted photos are remembered and
+    skipped, and also dropped from results when their rows are looked up.
+    """
+
+    def __init__(self, app):
+        self.max_users = int(os.environ.get('PHOTO_INDEX_MAX_USERS', 1000))
+        self._trees = OrderedDict()  # user_id -> {'tree', 'ids', 'version', 'removed'}
+        self._lock = threading.Lock()
+        self._user_locks = KeyLocks()
+
+    def _entry(self, user_id):
+        from app.models import MemoryPhoto
+
+        with self._lock:
+            entry = self._trees.get(user_id)
+            if entry is None:
+                entry = {'tree': BKTree(), 'ids': set(), 'version': None, 'removed': set()}
+                self._trees[user_id] = entry
+                while len(self._trees) > self.max_users:
+                    self._trees.popitem(last=False)
+            self._trees.move_to_end(user_id)
+
+        with self._user_locks.hold(user_id):
+            # Read before the rows, so a write racing the reload leaves the tree stale, not stamped current
+            version = current_photo_version(user_id)
+            if version is not None and version == entry['version']:
+                return entry
+
+            rows = db.session.query(MemoryPhoto.id, MemoryPhoto.dhash).filter(
+                MemoryPhoto.user_id == user_id,
+                MemoryPhoto.dhash.isnot(None)
+            ).all()
+            with self._lock:
+                # A stored hash never changes, so only rows the tree lacks need adding
+                for photo_id, value in rows:
+                    if photo_id not in entry['ids']:
+                        entry['tree'].add(to_unsigned(value), photo_id)
+                        entry['ids'].add(photo_id)
+                entry['version'] = version
+        return entry
+
+    def _applied(self, user_id, change):
+        """Apply change(entry) to a loaded tree after this process committed one photo_version bump"""
+        with self._lock:
+            entry = self._trees.get(user_id)
+        if entry is None:
+            return
+        with self._user_locks.hold(user_id):
+            version = current_photo_version(user_id)
+            with self._lock:
+                change(entry)
+                # Exactly one bump past the stamp means no other writer came between
+                if entry['version'] is not None and version == entry['version'] + 1:
+                    entry['version'] = version
+
+    def search(self, user_id, value, radius, exclude_id=None):
+        """[(distance, MemoryPhoto)] of this user's photos within radius of value, nearest first"""
+        from app.models import MemoryPhoto
+
+        entry = self._entry(int(user_id))
+        with self._lock:
+            matches = [(distance, photo_id) for distance, photo_id in entry['tree'].search(value, radius)
+                       if photo_id != exclude_id and photo_id not in entry['removed']]
+        if not matches:
+            return []
+
+        photos = {photo.id: photo for photo in
+                  MemoryPhoto.query.filter(MemoryPhoto.id.in_([photo_id for _, photo_id in matches]))}
+        with self._lock:
+            entry['removed'].update(photo_id for _, photo_id in matches if photo_id not in photos)
+        return [(distance, photos[photo_id]) for distance, photo_id in matches if photo_id in photos]
+
+    def added(self, user_id, photo_id, value):
+        """Put a committed upload's stored (signed) hash into the user's tree"""
+        def change(entry):
+            if photo_id not in entry['ids']:
+                entry['tree'].add(to_unsigned(value), photo_id)
+                entry['ids'].add(photo_id)
+        self._applied(int(user_id), change)
+
+    def removed(self, user_id, photo_id):
+        """Skip a deleted photo without waiting for a lookup to notice"""
+        self._applied(int(user_id), lambda entry: entry['removed'].add(photo_id))
+
+
+def backfill_photo_hashes(batch_size=200):
+    """Hash photos stored before hashing existed; returns (hashed, unreadable).
+
+    Each batch bumps the owners' photo_version, so running servers add these
+    photos to their trees on the user's next lookup.
+    """
+    from flask import current_app
+    from app.models import MemoryPhoto
+
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'memories')
+    hashed = unreadable = 0
+    last_id = 0
+    while True:
+        photos = MemoryPhoto.query.filter(
+            MemoryPhoto.dhash.is_(None), MemoryPhoto.id > last_id
+        ).order_by(MemoryPhoto.id).limit(batch_size).all()
+        if not photos:
+            return hashed, unreadable
+        owners = set()
+        for photo in photos:
+            last_id = photo.id
+            try:
+                photo.dhash = to_signed(dhash(os.path.join(folder, photo.filename)))
+                owners.add(photo.user_id)
+                hashed += 1
+            except Exception as e:
+                print(f"⚠️ Cannot hash photo {photo.id}: {e}")
+                unreadable += 1
+        bump_photo_version(*owners)
+        db.session.commit()
@@ -0,0 +1,174 @@
+# app/services/photostore.py
+#
+# Uploaded photos are stored once per user and distinct content. The upload
+# is hashed while it is written to a temp file; a new file is then kept under
+# a random name and a PhotoBlob row, keyed by (user_id, sha256), counts the
+# MemoryPhoto rows using it. Photo URLs need no login, so neither the name
+# nor any response may reveal the hash or whether other accounts hold the
+# same picture. Variants and resized copies are named after the blob file,
+# so duplicates share those as well. A blob and its files go away with its
+# last photo.
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.dbhelpers import insert_or_increment
+from app.models import MemoryPhoto, PhotoBlob
+from app.services.keylocks import KeyLocks
+from app.services.photovariants import VARIANT_FORMATS, VARIANT_SIZES, variant_filename
+
+CHUNK_SIZE = 1024 * 1024
+
+# A temp upload older than this is left over from a crash, not an upload in progress
+STALE_UPLOAD_SECONDS = 3600
+
+# Serialises "count the reference, then place or remove the file" per user and
+# content hash within this process, so a delete cannot unlink a file a concurrent
+# upload of the same bytes has just counted on
+_blob_locks = KeyLocks()
+
+
+def memories_folder():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'memories')
+
+
+def _write_hashed(stream, folder):
+    """Copy stream to a temp file in folder, hashing as it goes; returns (sha256, size, temp path)"""
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = os.path.join(folder, f".upload-{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'wb') as out:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size, tmp_path
+
+
+def remove_stale_uploads(folder=None):
+    """Delete temp files of uploads interrupted by a crash; returns how many were removed"""
+    folder = folder or memories_folder()
+    cutoff = time.time() - STALE_UPLOAD_SECONDS
+    removed = 0
+    for entry in os.scandir(folder):
+        if not (entry.name.startswith('.upload-') and entry.name.endswith('.tmp')):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def store_upload(file_storage, extension, user_id):
+    """Store an uploaded file by content and count one more reference to it, in the current transaction.
+
+    Returns (blob id, blob filename, True if these bytes were new for this
+    user). A new file is placed before the transaction commits and removed
+    again if it rolls back instead.
+    """
+    folder = memories_folder()
+    os.makedirs(folder, exist_ok=True)
+    sha256, size, tmp_path = _write_hashed(file_storage.stream, folder)
+
+    try:
+        with _blob_locks.hold(f"{user_id}:{sha256}"):
+            blob_id, filename, ref_count = db.session.execute(
+                insert_or_increment(PhotoBlob, ['user_id', 'sha256'], 'ref_count').values(
+                    user_id=user_id, sha256=sha256, filename=f"{uuid.uuid4().hex}.{extension}", size=size,
+                    ref_count=1, created_at=datetime.utcnow()
+                ).returning(PhotoBlob.id, PhotoBlob.filename, PhotoBlob.ref_count)
+            ).one()
+
+            path = os.path.join(folder, filename)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+                db.session().info.setdefault('placed_photo_files', []).append(path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return blob_id, filename, ref_count == 1
+
+
+@event.listens_for(Session, 'after_commit')
+def _keep_placed_files(session):
+    session.info.pop('placed_photo_files', None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _remove_placed_files(session):
+    # The blob rows of these files were never committed, nothing refers to them
+    for path in session.info.pop('placed_photo_files', []):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_files(filename):
+    """Delete a stored photo file with its variants and resized copies"""
+    folder = memories_folder()
+    names = [filename] + [variant_filename(filename, size, fmt) for size in VARIANT_SIZES for fmt in VARIANT_FORMATS]
+    for name in names:
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+
+    resize_cache = getattr(current_app, 'resize_cache', None)
+    if resize_cache:
+        resize_cache.discard(filename)
+
+
+def delete_photo(photo):
+    """Delete a MemoryPhoto and commit; its file goes too once no other photo uses it"""
+    filename = photo.filename
+    blob_id = photo.blob_id
+    db.session.delete(photo)
+
+    if blob_id is None:
+        # Uploaded before deduplication: the file belongs to this row alone
+        db.session.commit()
+        _remove_files(filename)
+        return True
+
+    blob = db.session.get(PhotoBlob, blob_id)
+    with _blob_locks.hold(f"{blob.user_id}:{blob.sha256}"):
+        db.session.execute(
+            db.update(PhotoBlob).where(PhotoBlob.id == blob_id).values(ref_count=PhotoBlob.ref_count - 1)
+        )
+        removed = db.session.execute(
+            db.delete(PhotoBlob).where(PhotoBlob.id == blob_id, PhotoBlob.ref_count <= 0)
+        ).rowcount
+        db.session.commit()
+
+        if removed:
+            _remove_files(filename)
+    return bool(removed)
+
+
+def duplicate_with_variants(photo):
+    """Another photo of the same blob whose variants are already built, if any"""
+    if photo.blob_id is None:
+        return None
+    return MemoryPhoto.query.filter(
+        MemoryPhoto.blob_id == photo.blob_id,
+        MemoryPhoto.id != photo.id,
+        MemoryPhoto.variants_status == 'ready'
+    ).first()
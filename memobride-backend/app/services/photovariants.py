@@ -0,0 +1,159 @@
+# app/services/photovariants.py
+import os
+import time
+import uuid
+
+from PIL import Image, ImageOps
+
+from app import db
+
+# name -> (width, height, crop). Thumbnails are square-cropped gallery tiles,
+# medium variants keep the aspect ratio and fit inside the box.
+VARIANT_SIZES = {
+    'thumb': (256, 256, True),
+    'medium': (1024, 1024, False),
+}
+
+# format -> (file extension, Pillow format, save options)
+VARIANT_FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_filename(filename, size, fmt):
+    """1_abc.png -> 1_abc_thumb.webp; lives next to the original in the memories folder"""
+    stem = filename.rsplit('.', 1)[0]
+    return f"{stem}_{size}.{VARIANT_FORMATS[fmt][0]}"
+
+
+def load_image(path, box):
+    """Open, decode at reduced scale (no smaller than box) where the codec allows it, and apply the EXIF orientation"""
+    with Image.open(path) as image:
+        # JPEG can decode straight to 1/2, 1/4 or 1/8 scale, which is most of the cost for phone photos
+        image.draft('RGB', box)
+        image = ImageOps.exif_transpose(image)
+
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _flatten(image):
+    """JPEG has no alpha channel, so put transparent images on white"""
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def save_image(image, path, fmt):
+    _, pillow_format, options = VARIANT_FORMATS[fmt]
+    if pillow_format == 'JPEG':
+        image = _flatten(image)
+    # Write then rename, so a variant is never served half-written
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    image.save(tmp_path, pillow_format, **options)
+    os.replace(tmp_path, path)
+
+
+def generate_variants(folder, filename):
+    """Write every size/format variant of folder/filename; returns {size: {width, height, fmt: filename}}"""
+    largest = max(max(width, height) for width, height, _ in VARIANT_SIZES.values())
+    source = load_image(os.path.join(folder, filename), (largest, largest))
+    variants = {}
+    # Largest first, so smaller sizes resample the already-reduced image
+    for size, (width, height, crop) in sorted(VARIANT_SIZES.items(), key=lambda item: -item[1][0]):
+        if crop:
+            resized = ImageOps.fit(source, (width, height), Image.Resampling.LANCZOS)
+        else:
+            resized = source.copy()
+            resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+        variants[size] = {'width': resized.width, 'height': resized.height}
+        for fmt in VARIANT_FORMATS:
+            name = variant_filename(filename, size, fmt)
+            save_image(resized, os.path.join(folder, name), fmt)
+            variants[size][fmt] = name
+        source = resized
+    return variants
+
+
+def build_photo_variants(photo_id):
+    """Generate and record the variants of one MemoryPhoto; runs in the worker pool"""
+    from flask import current_app
+    from app.models import MemoryPhoto
+
+    photo = db.session.get(MemoryPhoto, photo_id)
+    if not photo:
+        return None
+
+    if reuse_duplicate_variants(photo):
+        db.session.commit()
+        return photo.variants
+
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'memories')
+    started = time.perf_counter()
+    try:
+        photo.variants = generate_variants(folder, photo.filename)
+        photo.variants_status = 'ready'
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        photo.variants_status = 'failed'
+        db.session.commit()
+        raise
+
+    print(f"🖼️ Variants ready for photo {photo_id} in {time.perf_counter() - started:.2f}s")
+    return photo.variants
+
+
+def reuse_duplicate_variants(photo):
+    """Copy the variants of an identical, already processed upload; True if there was one"""
+    from app.services.photostore import duplicate_with_variants
+
+    duplicate = duplicate_with_variants(photo)
+    if not duplicate:
+        return False
+    photo.variants = duplicate.variants
+    photo.variants_status = 'ready'
+    return True
+
+
+class PhotoVariantPipeline:
+    """Generates photo variants off the request path, in a small bounded pool.
+
+    Resizing is CPU-bound, but Pillow releases the GIL while decoding and
+    encoding, so a couple of threads keep up with uploads without starving
+    request handling.
+    """
+
+    def __init__(self, app):
+        from app.services.jobrunner import JobRunner
+        self.jobs = JobRunner(app, max_workers=int(os.environ.get('PHOTO_VARIANT_WORKERS', 2)))
+
+    def submit(self, photo_id):
+        return self.jobs.submit('photo_variants', build_photo_variants, photo_id)
+
+    def shutdown(self):
+        self.jobs.shutdown()
+
+
+def backfill_photo_variants(retry_failed=False):
+    """Generate variants, in this process, for photos that have none; returns (ready, failed)"""
+    from app.models import MemoryPhoto
+
+    statuses = ['pending', 'failed'] if retry_failed else ['pending']
+    query = db.session.query(MemoryPhoto.id).filter(
+        db.or_(MemoryPhoto.variants_status.is_(None), MemoryPhoto.variants_status.in_(statuses))
+    ).order_by(MemoryPhoto.id)
+
+    ready = failed = 0
+    for (photo_id,) in query.all():
+        try:
+            build_photo_variants(photo_id)
+            ready += 1
+        except Exception as e:
+            print(f"❌ Variants failed for photo {photo_id}: {e}")
+            failed += 1
+    return ready, failed
@@ -0,0 +1,207 @@
+# app/services/resizecache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from app.services import metrics
+from app.services.keylocks import KeyLocks
+from app.services.photovariants import VARIANT_FORMATS, load_image, save_image
+
+# Sizes ?w= and ?h= are rounded up to. The endpoint needs no login, so each
+# photo must only have a handful of possible resized copies; otherwise
+# arbitrary sizes could force endless resizes and flush the cache.
+RESIZE_STEPS = (64, 128, 256, 384, 512, 768, 1024, 1536, 2048)
+# Upper bound for ?w= and ?h=; larger requests would only cache near-originals
+MAX_RESIZE_DIMENSION = RESIZE_STEPS[-1]
+
+# Seconds between rescans of the cache folder, which other processes write to as well
+RESCAN_SECONDS = 60
+# A .tmp file older than this is left over from a crash, not a write in progress
+STALE_TMP_SECONDS = 3600
+
+
+def snap_dimension(value):
+    """Smallest allowed resize step that is at least value"""
+    return next(step for step in RESIZE_STEPS if step >= value)
+
+
+def parse_resize_args(args):
+    """(width, height, fmt) from ?w=&h=&fmt=, or None when the original is wanted; raises ValueError.
+
+    Dimensions are rounded up to the next of RESIZE_STEPS, so the caller may
+    get a slightly larger image than it asked for.
+    """
+    if not any(args.get(name) for name in ('w', 'h', 'fmt')):
+        return None
+
+    dimensions = []
+    for name in ('w', 'h'):
+        value = args.get(name)
+        if not value:
+            dimensions.append(None)
+            continue
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f'{name} must be a whole number of pixels')
+        if not 1 <= value <= MAX_RESIZE_DIMENSION:
+            raise ValueError(f'{name} must be between 1 and {MAX_RESIZE_DIMENSION}')
+        dimensions.append(snap_dimension(value))
+
+    fmt = (args.get('fmt') or 'webp').lower()
+    fmt = 'jpeg' if fmt == 'jpg' else fmt
+    if fmt not in VARIANT_FORMATS:
+        raise ValueError(f"fmt must be one of: {', '.join(VARIANT_FORMATS)}")
+    return dimensions[0], dimensions[1], fmt
+
+
+def resize_image(source_path, target_path, width, height, fmt):
+    """Both sides given: crop to exactly width x height. One side: scale, keeping the aspect ratio"""
+    image = load_image(source_path, (width or 1, height or 1))
+    if width and height:
+        image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    elif width or height:
+        ratio = (width / image.width) if width else (height / image.height)
+        if ratio < 1:
+            size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+            image = image.resize(size, Image.Resampling.LANCZOS)
+    save_image(image, target_path, fmt)
+
+
+class ResizeCache:
+    """Resized photos on disk, bounded by total size with least-recently-used eviction.
+
+    The first request for a size does the resize while holding that key's
+    lock; identical requests arriving meanwhile wait on the lock and then
+    find the file. Recency is kept in memory and mirrored in file mtimes, so
+    the LRU order survives restarts.
+
+    Several worker processes may share the folder. A file another process
+    wrote is adopted as a hit instead of being rebuilt, and a listed file it
+    evicted is a miss. The folder is rescanned every RESCAN_SECONDS and
+    before evicting, so the size bound applies to the files of every
+    process together, not to each process's own.
+    """
+
+    def __init__(self, app):
+        self.folder = os.environ.get('PHOTO_RESIZE_CACHE_DIR') or \
+            os.path.join(app.config['UPLOAD_FOLDER'], 'cache', 'resized')
+        self.max_bytes = int(float(os.environ.get('PHOTO_RESIZE_CACHE_MAX_MB', 256)) * 1024 * 1024)
+        self._entries = OrderedDict()  # filename -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self._scanned_at = 0
+        self._lock = threading.Lock()
+        self._key_locks = KeyLocks()
+
+        os.makedirs(self.folder, exist_ok=True)
+        with self._lock:
+            self._rescan()
+            self._evict()
+        metrics.resize_cache_bytes.set_function(lambda: self._total_bytes)
+
+    def _rescan(self):
+        """Rebuild the LRU list from the files on disk, oldest mtime first; caller holds self._lock"""
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.folder):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.tmp'):
+                # Left over from a crash mid-write; recent ones may be another process writing
+                if now - stat.st_mtime > STALE_TMP_SECONDS:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+                continue
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self._total_bytes = sum(self._entries.values())
+        self._scanned_at = now
+
+    @staticmethod
+    def cache_filename(filename, width, height, fmt):
+        stem = filename.rsplit('.', 1)[0]
+        return f"{stem}_{width or ''}x{height or ''}.{VARIANT_FORMATS[fmt][0]}"
+
+    def get(self, source_path, width, height, fmt):
+        """Path of the resized copy of source_path, resizing it first if it is not cached"""
+        name = self.cache_filename(os.path.basename(source_path), width, height, fmt)
+        path = os.path.join(self.folder, name)
+
+        if self._touch(name, path):
+            metrics.resize_cache_requests.inc(outcome='hit')
+            return path
+
+        with self._key_locks.hold(name):
+            # Someone else may have built it while we waited for the lock
+            if self._touch(name, path):
+                metrics.resize_cache_requests.inc(outcome='hit')
+                return path
+
+            with metrics.resize_duration.time():
+                resize_image(source_path, path, width, height, fmt)
+            self._add(name, os.path.getsize(path))
+            metrics.resize_cache_requests.inc(outcome='miss')
+            return path
+
+    def discard(self, filename):
+        """Remove every cached size of filename, e.g. after the photo was deleted"""
+        prefix = filename.rsplit('.', 1)[0] + '_'
+        for entry in os.scandir(self.folder):
+            if entry.name.startswith(prefix):
+                self._forget(entry.name)
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _touch(self, name, path):
+        try:
+            now = time.time()
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            self._forget(name)
+            return False
+
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                return True
+        # Written by another process since our last scan
+        try:
+            self._add(name, os.path.getsize(path))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _add(self, name, size):
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            if self._total_bytes > self.max_bytes or time.time() - self._scanned_at > RESCAN_SECONDS:
+                self._rescan()
+            self._evict()
+
+    def _forget(self, name):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(name, 0)
+
+    def _evict(self):
+        # Caller holds self._lock (or is __init__); the newest entry always stays
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+            metrics.resize_cache_evictions.inc()
@@ -0,0 +1,186 @@
+# app/services/schedulecache.py
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from app import db
+from app.models import UserActivity, ActivityCompletion
+from app.services.activityscheduler import weekday_bit
+
+
+def build_today_schedule(user_id, day=None):
+    """Active activities of one user with their completion status for a day, in one query"""
+    day = day or date.today()
+    rows = today_schedule_query(user_id, day).all()
+
+    schedule = {
+        'user_id': int(user_id),
+        'date': day.isoformat(),
+        'activities': [_activity_entry(activity, day, completion_id) for activity, completion_id in rows]
+    }
+    _sort(schedule)
+    return schedule
+
+
+def today_schedule_query(user_id, day):
+    """(UserActivity, completion id or None) for each active activity of one user"""
+    return db.session.query(UserActivity, ActivityCompletion.id).outerjoin(
+        ActivityCompletion,
+        db.and_(
+            ActivityCompletion.activity_id == UserActivity.id,
+            ActivityCompletion.completed_on == day
+        )
+    ).filter(
+        UserActivity.user_id == user_id,
+        UserActivity.is_active == True
+    )
+
+
+def _activity_entry(activity, day, completion_id=None):
+    return {
+        'id': activity.id,
+        'name': activity.activity_name,
+        'scheduled_time': activity.scheduled_time,
+        'days_of_week': activity.days_of_week,
+        'days_mask': activity.days_mask,
+        'scheduled_today': bool((activity.days_mask or 0) & weekday_bit(day.isoweekday())),
+        'completed': completion_id is not None,
+        'completion_id': completion_id
+    }
+
+
+def _sort(schedule):
+    schedule['activities'].sort(key=lambda entry: (entry['scheduled_time'] or '', entry['id']))
+
+
+class _LocalStore:
+    """In-process LRU of (data_version, schedule) entries keyed by user id"""
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+            return entry
+
+    def set(self, user_id, version, schedule):
+        """Store an entry unless a build from a newer data_version is already cached"""
+        with self._lock:
+            current = self._entries.get(user_id)
+            if current is not None and current[0] > version:
+                return
+            self._entries[user_id] = (version, schedule)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _RedisStore:
+    """Entries shared by every process through Redis, expiring at the end of their day"""
+
+    def __init__(self, url, prefix='memobridge:today:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, user_id):
+        raw = self.client.get(f'{self.prefix}{user_id}')
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        return entry.get('version'), entry.get('schedule')
+
+    def set(self, user_id, version, schedule):
+        end_of_day = datetime.combine(date.fromisoformat(schedule['date']) + timedelta(days=1), datetime.min.time())
+        ttl = max(int((end_of_day - datetime.now()).total_seconds()), 1)
+        self.client.set(f'{self.prefix}{user_id}', json.dumps({'version': version, 'schedule': schedule}), ex=ttl)
+
+    def delete(self, user_id):
+        self.client.delete(f'{self.prefix}{user_id}')
+
+
+class TodayScheduleCache:
+    """Per-user "today" schedule, built once per day and refreshed on writes.
+
+    Each entry is stamped with the user's data_version (see app.conditional),
+    which every write to the user's activities and completions bumps. A read
+    costs one primary-key lookup of that counter; the cached schedule is used
+    only while the counter still matches, so a write handled by another
+    worker process is seen on the next read instead of at midnight. The stamp
+    is read before the schedule is built, so a build racing a write ends up
+    with an older stamp and is rebuilt rather than served. Cached schedules
+    are replaced, never mutated, so readers may hold on to the one they got.
+
+    In process the cache is an LRU of SCHEDULE_CACHE_MAX_USERS users.
+    Setting SCHEDULE_CACHE_REDIS_URL shares it between processes, so a
+    rebuild in one worker serves the others too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.shared = False
+        self.store = _LocalStore(int(os.environ.get('SCHEDULE_CACHE_MAX_USERS', 1024)))
+
+        redis_url = os.environ.get('SCHEDULE_CACHE_REDIS_URL')
+        if redis_url:
+            try:
+                self.store = _RedisStore(redis_url)
+                self.shared = True
+            except ImportError:
+                print("⚠️ redis package not installed, using the in-process schedule cache")
+
+    def get(self, user_id):
+        """Today's schedule for a user, building it on a miss, after a write or after midnight"""
+        from app.conditional import current_data_version
+
+        user_id = int(user_id)
+        today = date.today()
+        version = current_data_version(user_id) or 0
+        try:
+            entry = self.store.get(user_id)
+        except Exception as e:
+            print(f"⚠️ Schedule cache read failed: {e}")
+            entry = None
+
+        if entry is not None:
+            cached_version, schedule = entry
+            if cached_version == version and schedule and schedule['date'] == today.isoformat():
+                return schedule
+
+        schedule = build_today_schedule(user_id, today)
+        self._store(user_id, version, schedule)
+        return schedule
+
+    def invalidate(self, user_id):
+        try:
+            self.store.delete(int(user_id))
+        except Exception as e:
+            print(f"⚠️ Schedule cache invalidate failed: {e}")
+
+    def refresh(self, user_id):
+        """Write through: rebuild after a committed write, stamped with the version read before the build"""
+        from app.conditional import current_data_version
+
+        user_id = int(user_id)
+        version = current_data_version(user_id) or 0
+        self._store(user_id, version, build_today_schedule(user_id))
+
+    def _store(self, user_id, version, schedule):
+        try:
+            self.store.set(user_id, version, schedule)
+        except Exception as e:
+            print(f"⚠️ Schedule cache write failed: {e}")
@@ -0,0 +1,48 @@
+# bench_email_templates.py - per-message cost of rendering and MIME building
+#
+# Run from memobride-backend/:  python -m benchmarks.bench_email_templates [messages]
+import sys
+import time
+from types import SimpleNamespace
+
+from app.services.emailtemplates import EmailTemplates
+
+
+def bench(label, func, messages):
+    started = time.perf_counter()
+    for i in range(messages):
+        func(i)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {messages:>7} msgs  {elapsed * 1e6 / messages:8.1f} µs/msg")
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    # Import lazily so the numbers below exclude app start-up
+    from app.notificationservices import NotificationService
+
+    started = time.perf_counter()
+    templates = EmailTemplates()
+    print(f"Template compilation: {(time.perf_counter() - started) * 1000:.1f} ms (once at startup)")
+
+    service = NotificationService.__new__(NotificationService)
+    service.templates = templates
+    service.smtp_config = {'from_name': 'Memobridge Care Team', 'from_email': 'care@example.com'}
+
+    user = SimpleNamespace(name='Margaret <Peggy> Smith', email='peggy@example.com')
+    member = SimpleNamespace(name='Tom & Ann', email='family@example.com')
+
+    def render(i):
+        return service.compose_missed_activity_alert_to_family(user, member, f'Medication {i}', '09:00', 'high')
+
+    def render_and_build(i):
+        subject, plain, html = render(i)
+        return service.build_email(member.email, subject, plain, html).as_bytes()
+
+    bench('render family_alert', render, messages)
+    bench('render + MIME + serialize', render_and_build, messages)
+
+
+if __name__ == '__main__':
+    main()
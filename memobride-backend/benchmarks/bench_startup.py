@@ -0,0 +1,68 @@
+# bench_startup.py - create_app() cost as the number of users grows
+#
+# Run from memobride-backend/:  python -m benchmarks.bench_startup [users ...]
+#
+# Each size gets a fresh SQLite database seeded with that many users (and five
+# activities each). Boot time should stay flat: nothing in create_app() may
+# scan users any more. Background threads are stopped between runs.
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from app import create_app
+
+
+def seed(path, users):
+    now = datetime.utcnow().isoformat(sep=' ')
+    connection = sqlite3.connect(path)
+    connection.executemany(
+        'INSERT INTO user (email, password_hash, name, phone, created_at, data_version, photo_version) '
+        'VALUES (?, ?, ?, ?, ?, 0, 0)',
+        ((f'user{i}@example.com', 'x', f'User {i}', '', now) for i in range(users))
+    )
+    connection.execute(
+        "INSERT INTO user_activity (user_id, activity_name, scheduled_time, days_of_week, days_mask, is_active, "
+        "created_at) SELECT user.id, defaults.name, defaults.time, '1,2,3,4,5,6,7', 127, 1, ? FROM user CROSS JOIN "
+        "(SELECT 'Morning Medication' AS name, '09:00' AS time UNION ALL SELECT 'Lunch', '12:00' "
+        "UNION ALL SELECT 'Rest', '14:00' UNION ALL SELECT 'Evening Medication', '18:00' "
+        "UNION ALL SELECT 'Dinner', '19:00') AS defaults",
+        (now,)
+    )
+    connection.commit()
+    connection.close()
+
+
+def boot(path):
+    started = time.perf_counter()
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        # Keep the upload and resize-cache folders out of the source tree
+        'UPLOAD_FOLDER': tempfile.mkdtemp(dir=os.path.dirname(path)),
+    })
+    elapsed = time.perf_counter() - started
+    app.notification_service.stop_monitoring()
+    return elapsed
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [0, 1000, 10000, 50000]
+
+    with tempfile.TemporaryDirectory() as folder:
+        results = []
+        for users in sizes:
+            path = os.path.join(folder, f'bench_{users}.db')
+            boot(path)  # first boot creates the schema
+            seed(path, users)
+            results.append((users, min(boot(path) for _ in range(3))))
+
+    print()
+    print(f"{'users':>8}  {'create_app()':>14}")
+    for users, elapsed in results:
+        print(f"{users:>8}  {elapsed * 1000:>11.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+# conftest.py - a fresh app on a temporary SQLite database for each test
+#
+# Run from memobride-backend/:  python -m pytest tests
+import os
+import tempfile
+
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def app():
+    with tempfile.TemporaryDirectory() as folder:
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(folder, 'test.db')}",
+            'UPLOAD_FOLDER': os.path.join(folder, 'uploads'),
+        })
+        try:
+            yield app
+        finally:
+            app.notification_service.stop_monitoring()
+            with app.app_context():
+                from app import db
+                db.session.remove()
+                db.engine.dispose()
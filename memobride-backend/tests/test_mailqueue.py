@@ -0,0 +1,153 @@
+# test_mailqueue.py - MailQueue against a stub SMTP server
+import threading
+from email.mime.text import MIMEText
+
+from app.services.mailqueue import MailQueue
+
+CONFIG = {'server': 'smtp.test', 'port': 25, 'use_tls': True, 'username': 'user', 'password': 'secret'}
+
+
+class StubSMTP:
+    """Records what the queue does with a session; failures are scripted per test"""
+
+    def __init__(self, server, sessions, host, port, timeout=None):
+        self.server = server
+        self.sent = []
+        self.noops = 0
+        self.closed = False
+        sessions.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def noop(self):
+        self.noops += 1
+        return (250, b'OK') if self.server.healthy else (421, b'closing')
+
+    def send_message(self, msg):
+        if self.server.fail_next:
+            self.server.fail_next -= 1
+            raise ConnectionResetError('connection dropped')
+        self.sent.append(msg['To'])
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+class StubServer:
+    def __init__(self):
+        self.sessions = []
+        self.healthy = True
+        self.fail_next = 0
+        self.lock = threading.Lock()
+
+    def factory(self, host, port, timeout=None):
+        with self.lock:
+            return StubSMTP(self, self.sessions, host, port, timeout)
+
+    @property
+    def sent(self):
+        return [to for session in self.sessions for to in session.sent]
+
+
+def message(to):
+    msg = MIMEText('body')
+    msg['To'] = to
+    msg['Subject'] = 'test'
+    return msg
+
+
+def make_queue(server, **kwargs):
+    return MailQueue(CONFIG, smtp_factory=server.factory, **kwargs)
+
+
+def test_messages_share_one_session_per_worker():
+    server = StubServer()
+    mail = make_queue(server, workers=1, batch_size=5)
+    results = []
+    for i in range(12):
+        assert mail.enqueue(message(f'user{i}@example.com'), on_result=lambda ok, error: results.append(ok))
+    mail.join()
+    mail.stop()
+
+    assert len(server.sessions) == 1
+    assert sorted(server.sent) == sorted(f'user{i}@example.com' for i in range(12))
+    assert results == [True] * 12
+
+
+def test_session_is_checked_with_noop_before_reuse():
+    server = StubServer()
+    mail = make_queue(server, workers=1, health_check_after=0)
+    mail.enqueue(message('first@example.com'))
+    mail.join()
+    mail.enqueue(message('second@example.com'))
+    mail.join()
+    mail.stop()
+
+    assert len(server.sessions) == 1
+    assert server.sessions[0].noops == 1
+
+
+def test_unhealthy_session_is_replaced():
+    server = StubServer()
+    mail = make_queue(server, workers=1, health_check_after=0)
+    mail.enqueue(message('first@example.com'))
+    mail.join()
+    server.healthy = False
+    mail.enqueue(message('second@example.com'))
+    mail.join()
+    mail.stop()
+
+    assert len(server.sessions) == 2
+    assert server.sessions[0].closed
+    assert server.sent == ['first@example.com', 'second@example.com']
+
+
+def test_reconnects_once_after_a_dropped_session():
+    server = StubServer()
+    mail = make_queue(server, workers=1)
+    results = []
+    mail.enqueue(message('first@example.com'))
+    mail.join()
+    server.fail_next = 1
+    mail.enqueue(message('second@example.com'), on_result=lambda ok, error: results.append(ok))
+    mail.join()
+    mail.stop()
+
+    assert len(server.sessions) == 2
+    assert server.sent == ['first@example.com', 'second@example.com']
+    assert results == [True]
+
+
+def test_reports_failure_when_the_retry_fails_too():
+    server = StubServer()
+    mail = make_queue(server, workers=1)
+    results = []
+    server.fail_next = 2
+    mail.enqueue(message('lost@example.com'), on_result=lambda ok, error: results.append((ok, type(error))))
+    mail.join()
+    mail.stop()
+
+    assert results == [(False, ConnectionResetError)]
+
+
+def test_stop_joins_the_pool_before_a_restart():
+    server = StubServer()
+    mail = make_queue(server, workers=2, idle_timeout=60)
+    mail.enqueue(message('first@example.com'))
+    mail.join()
+    old_workers = list(mail._threads)
+
+    mail.stop(timeout=5)
+    assert not any(thread.is_alive() for thread in old_workers)
+
+    mail.enqueue(message('second@example.com'))
+    mail.join()
+    mail.stop()
+    assert server.sent == ['first@example.com', 'second@example.com']
@@ -0,0 +1,37 @@
+# test_queryplans.py - every endpoint query must be served by an index
+from datetime import date, datetime
+
+from app import db
+from app.models import (ActivityCompletion, FamilyMember, GameSession, MemoryPhoto, MissedActivity, User,
+                        UserActivity)
+from app.queryplans import QUERIES, check_query_plans
+
+
+def seed():
+    user = User(email='plans@example.com', password_hash='x', name='Plans')
+    db.session.add(user)
+    db.session.flush()
+
+    activities = [UserActivity(user_id=user.id, activity_name=name, scheduled_time=time)
+                  for name, time in [('Morning Medication', '09:00'), ('Lunch', '12:00'), ('Dinner', '19:00')]]
+    db.session.add_all(activities)
+    db.session.flush()
+
+    db.session.add_all([
+        FamilyMember(user_id=user.id, name='Ann', relation='daughter', email='ann@example.com'),
+        ActivityCompletion(activity_id=activities[0].id, completed_on=date(2024, 1, 1)),
+        MissedActivity(user_id=user.id, activity_name='Lunch', scheduled_time='12:00', importance='medium'),
+        MemoryPhoto(user_id=user.id, filename='a.jpg', original_filename='a.jpg', uploaded_at=datetime(2024, 1, 1)),
+        GameSession(user_id=user.id, game_type='tic_tac_toe', score=1),
+    ])
+    db.session.commit()
+
+
+def test_every_query_is_index_backed(app):
+    with app.app_context():
+        seed()
+        results = check_query_plans()
+
+    assert [name for name, _, _, _ in results] == [name for name, _, _, _ in QUERIES]
+    failures = {name: problems for name, ok, _, problems in results if not ok}
+    assert not failures